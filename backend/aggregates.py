@@ -0,0 +1,335 @@
+import click
+from datetime import datetime, timedelta
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import db, Budget, BudgetTotal, Expense, SpendingRollup
+from money import Cents, ZERO
+from versions import stamp, stamp_users, touch_budget
+
+totals_cli = AppGroup("totals", help="Maintain the budget_totals running totals and rollups.")
+
+ROLLUP_GRANULARITIES = ("day", "week", "month")
+
+# Budget period -> rollup granularity that holds its per-period total
+PERIOD_GRANULARITY = {"monthly": "month", "weekly": "week"}
+
+
+def as_day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def rollup_start(granularity, day):
+    """Start of the day / week (Monday) / month containing `day`"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def period_start_sql(granularity, column):
+    """SQL expression truncating a datetime column to its day / week / month"""
+    if db.session.get_bind().dialect.name == "postgresql":
+        return db.cast(db.func.date_trunc(granularity, column), db.Date)
+    if granularity == "week":
+        expression = db.func.date(column, "weekday 0", "-6 days")
+    elif granularity == "month":
+        expression = db.func.strftime("%Y-%m-01", column)
+    else:
+        expression = db.func.date(column)
+    return db.type_coerce(expression, db.Date)
+
+
+def bump(model, key, amount, count=None):
+    """Add to the counter row identified by `key`, creating it if needed, in
+    one statement where the database supports upserts"""
+    values = dict(key, total=amount)
+    increments = {"total": model.total + amount}
+    if count is not None:
+        values["count"] = count
+        increments["count"] = model.count + count
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        statement = insert(model).values(**values)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: getattr(model, column) + statement.excluded[column] for column in increments}
+        ))
+        return
+
+    if not db.session.get(model, tuple(key.values())):
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(model).values(**key))
+        except IntegrityError:
+            pass
+    db.session.execute(
+        db.update(model)
+        .where(*[getattr(model, column) == value for column, value in key.items()])
+        .values(**increments)
+    )
+
+
+def apply_expense_delta(user_id, category_id, day, amount, count=1):
+    """Add `amount` (and `count` expenses) to every running total the expense
+    dated `day` belongs to: the lifetime budget_totals row and its day, week
+    and month rollups.
+
+    Runs inside the caller's transaction, so the totals are committed (or
+    rolled back) together with the expense write that produced them. Locks
+    are always taken user row first (the data version stamp), then the
+    budget_totals row, then the rollups, so a bulk insert or a category
+    change touching several categories can't deadlock against a single
+    expense write. The budget_totals row lock is what serializes
+    concurrent writers to the same category (see reserve_budget). The
+    category's budget is marked changed for ?since= deltas.
+    """
+    stamp(user_id)
+    bump(BudgetTotal, {"user_id": user_id, "category_id": category_id}, amount)
+    touch_budget(user_id, category_id)
+    if day is None:
+        return
+    day = as_day(day)
+    for granularity in ROLLUP_GRANULARITIES:
+        bump(SpendingRollup, {
+            "user_id": user_id,
+            "category_id": category_id,
+            "granularity": granularity,
+            "period_start": rollup_start(granularity, day)
+        }, amount, count)
+
+
+def reserve_budget(budget, day, amount):
+    """Add `amount` to the running totals for an expense dated `day` and check
+    that the budget period it falls in stays within the limit; returns False
+    when it doesn't, in which case the caller must roll back.
+
+    The totals are written before they are read back, so the check can't
+    race. On Postgres the budget_totals row stays locked until commit, and a
+    concurrent request blocks on it and then reads the committed totals.
+    SQLite allows one writer at a time, so the check runs serialized there.
+    """
+    apply_expense_delta(budget.user_id, budget.category_id, day, amount)
+    return period_spent(budget, day) <= budget.limit
+
+
+def period_spent(budget, day):
+    """Spent in the budget period containing `day`: one rollup row for
+    monthly/weekly budgets, budget_totals for lifetime ones, and the day
+    rollups of the window for custom ones"""
+    day = as_day(day)
+    if budget.period in PERIOD_GRANULARITY:
+        granularity = PERIOD_GRANULARITY[budget.period]
+        return db.session.query(SpendingRollup.total).filter_by(
+            user_id=budget.user_id,
+            category_id=budget.category_id,
+            granularity=granularity,
+            period_start=rollup_start(granularity, day)
+        ).scalar() or ZERO
+
+    if budget.period == "custom":
+        start, end = budget.period_bounds(day)
+        return db.session.query(db.func.sum(SpendingRollup.total)).filter(
+            SpendingRollup.user_id == budget.user_id,
+            SpendingRollup.category_id == budget.category_id,
+            SpendingRollup.granularity == "day",
+            SpendingRollup.period_start >= start,
+            SpendingRollup.period_start < end
+        ).scalar() or ZERO
+
+    return get_spent_total(budget.user_id, budget.category_id)
+
+
+def get_spent_total(user_id, category_id):
+    """Total spent in a category, read by primary key from budget_totals"""
+    return db.session.query(BudgetTotal.total).filter_by(
+        user_id=user_id,
+        category_id=category_id
+    ).scalar() or ZERO
+
+
+def budgets_with_spent(user_id, day=None, since=None):
+    """Return (budget, spent) pairs for all of a user's budgets (or only those
+    changed after data version `since`), with spent taken from the period
+    containing `day` (today by default).
+
+    Lifetime, monthly and weekly budgets come back from one query that LEFT
+    JOINs budget_totals and the matching rollup row, so categories without
+    expenses still come back with a spent of 0. Custom-period budgets each
+    add one bounded query over their window's day rollups.
+    """
+    day = day or datetime.utcnow().date()
+    spent = db.case(
+        (Budget.period == "lifetime", BudgetTotal.total),
+        else_=SpendingRollup.total
+    )
+    rows = db.session.query(
+        Budget,
+        db.func.coalesce(spent, 0, type_=Cents)
+    ).outerjoin(
+        BudgetTotal,
+        db.and_(BudgetTotal.user_id == Budget.user_id, BudgetTotal.category_id == Budget.category_id)
+    ).outerjoin(
+        SpendingRollup,
+        db.and_(
+            SpendingRollup.user_id == Budget.user_id,
+            SpendingRollup.category_id == Budget.category_id,
+            db.or_(
+                db.and_(Budget.period == "monthly", SpendingRollup.granularity == "month",
+                        SpendingRollup.period_start == rollup_start("month", day)),
+                db.and_(Budget.period == "weekly", SpendingRollup.granularity == "week",
+                        SpendingRollup.period_start == rollup_start("week", day))
+            )
+        )
+    ).filter(
+        Budget.user_id == user_id,
+        Budget.version > since if since is not None else db.true()
+    ).order_by(Budget.id).all()
+
+    return [
+        (budget, period_spent(budget, day) if budget.period == "custom" else total)
+        for budget, total in rows
+    ]
+
+
+def rollup_history(user_id, granularity, category_id=None, start=None, end=None, limit=None):
+    """Rollup rows for a user, newest period first, read without touching expense"""
+    query = SpendingRollup.query.filter(
+        SpendingRollup.user_id == user_id,
+        SpendingRollup.granularity == granularity
+    )
+    if category_id is not None:
+        query = query.filter(SpendingRollup.category_id == category_id)
+    if start:
+        query = query.filter(SpendingRollup.period_start >= start)
+    if end:
+        query = query.filter(SpendingRollup.period_start < end)
+    query = query.order_by(SpendingRollup.period_start.desc(), SpendingRollup.category_id)
+    return query.limit(limit).all() if limit else query.all()
+
+
+def budget_period_history(budget, periods, day=None):
+    """(period_start, spent, count) for the budget's last `periods` periods,
+    newest first, including empty ones. Lifetime budgets report by month;
+    custom windows are summed from day rollups."""
+    day = as_day(day or datetime.utcnow().date())
+    if budget.period == "custom":
+        start, end = budget.period_bounds(day)
+        starts = [start - timedelta(days=budget.period_days * i) for i in range(periods)]
+        granularity = "day"
+    else:
+        granularity = PERIOD_GRANULARITY.get(budget.period, "month")
+        starts = [rollup_start(granularity, day)]
+        while len(starts) < periods:
+            starts.append(rollup_start(granularity, starts[-1] - timedelta(days=1)))
+        end = None
+
+    history = {start: [ZERO, 0] for start in starts}
+    for row in rollup_history(budget.user_id, granularity, budget.category_id, start=starts[-1], end=end):
+        if granularity == "day":
+            key = max(start for start in starts if start <= row.period_start)
+        else:
+            key = row.period_start
+        history[key][0] += row.total
+        history[key][1] += row.count
+    return [(start, total, count) for start, (total, count) in history.items()]
+
+
+def expense_totals_select():
+    """Per-(user, category) totals recomputed from the expense table"""
+    return db.select(
+        Expense.user_id,
+        Expense.category_id,
+        db.func.sum(Expense.amount)
+    ).group_by(Expense.user_id, Expense.category_id)
+
+
+def expense_rollups_select(granularity):
+    """Rollup rows for one granularity recomputed from the expense table"""
+    start = period_start_sql(granularity, Expense.date)
+    return db.select(
+        Expense.user_id,
+        Expense.category_id,
+        db.literal(granularity, db.String),
+        start,
+        db.func.sum(Expense.amount),
+        db.func.count()
+    ).where(Expense.date.isnot(None)).group_by(Expense.user_id, Expense.category_id, start)
+
+
+def rebuild_totals(user_ids=None):
+    """Recompute budget_totals and spending_rollups from scratch; returns the
+    number of rows written.
+
+    The data versions of `user_ids` (every user by default) are bumped in
+    the same transaction, so clients and the summary cache don't keep
+    serving totals from before the rebuild. Users are locked first, as in
+    apply_expense_delta.
+    """
+    stamp_users(user_ids)
+    BudgetTotal.query.delete(synchronize_session=False)
+    SpendingRollup.query.delete(synchronize_session=False)
+
+    written = db.session.execute(
+        db.insert(BudgetTotal).from_select(["user_id", "category_id", "total"], expense_totals_select())
+    ).rowcount
+    for granularity in ROLLUP_GRANULARITIES:
+        written += db.session.execute(
+            db.insert(SpendingRollup).from_select(
+                ["user_id", "category_id", "granularity", "period_start", "total", "count"],
+                expense_rollups_select(granularity)
+            )
+        ).rowcount
+    db.session.commit()
+    return written
+
+
+def find_total_drift():
+    """Return (user_id, label, stored, actual) for every running total or
+    rollup that disagrees with the expense table"""
+    actual = {(u, c): total for u, c, total in db.session.execute(expense_totals_select())}
+    stored = {(t.user_id, t.category_id): t.total for t in BudgetTotal.query}
+    for granularity in ROLLUP_GRANULARITIES:
+        actual.update({
+            (u, c, g, start): total
+            for u, c, g, start, total, _ in db.session.execute(expense_rollups_select(granularity))
+        })
+    stored.update({
+        (r.user_id, r.category_id, r.granularity, r.period_start): r.total for r in SpendingRollup.query
+    })
+
+    drift = []
+    for key in sorted(set(actual) | set(stored), key=str):
+        if stored.get(key, ZERO) != actual.get(key, ZERO):
+            label = f"user {key[0]} / category {key[1]}" + "".join(f" / {part}" for part in key[2:])
+            drift.append((key[0], label, stored.get(key, ZERO), actual.get(key, ZERO)))
+    return drift
+
+
+@totals_cli.command("rebuild")
+def rebuild_command():
+    """Recompute every running total and rollup from the expense table.
+
+    Bumps every user's data version, so clients refetch their totals."""
+    count = rebuild_totals()
+    click.echo(f"Rebuilt {count} budget totals and rollups.")
+
+
+@totals_cli.command("verify")
+@click.option("--repair", is_flag=True, help="Rebuild the totals if any drift is found.")
+def verify_command(repair):
+    """Compare running totals and rollups with the expense table and report drift."""
+    drift = find_total_drift()
+    for _, label, stored, actual in drift:
+        click.echo(f"{label}: stored {stored:.2f}, actual {actual:.2f}")
+
+    if not drift:
+        click.echo("Budget totals are consistent.")
+    elif repair:
+        rebuild_totals({user_id for user_id, *_ in drift})
+        click.echo(f"Repaired {len(drift)} drifted totals.")
+    else:
+        raise SystemExit(1)
@@ -4,27 +4,44 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
 from flask_mail import Mail
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 
 # Import models & blueprints
-from models import db, TokenBlocklist, Budget  # Ensure Budget model has expense_id
+from models import db
 from views.auth import auth_bp
 from views.user import user_bp
 from views.budget import budget_bp
 from views.expense import expense_bp
+from views.reports import reports_bp
+from views.categories import categories_bp
+from aggregates import totals_cli
+from blocklist import blocklist_cache, prune_command
+from cache import summary_cache
+from forecast import forecast_command
+from images import MAX_IMAGE_BYTES, backfill_command
+from notifications import notification_worker, notifications_cli
+from passwords import password_hasher
+from instrumentation import query_instrumentation
+from metrics import metrics
+from logs import log_pipeline
+from database import database_uri, engine_options, init_engine
+from money import MoneyJSONProvider
 
 # Initialize Flask-Mail
 mail = Mail()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
+    app.json = MoneyJSONProvider(app)
 
     # CORS configuration
     CORS(app,
          resources={r"/*": {
              "origins": "http://localhost:5173",
              "methods": ["GET", "POST", "OPTIONS", "PUT", "DELETE"],
-             "allow_headers": ["Content-Type", "Authorization"]
+             "allow_headers": ["Content-Type", "Authorization", "If-None-Match", "If-Modified-Since", "X-Request-ID"],
+             "expose_headers": ["X-Next-Cursor", "ETag", "Last-Modified", "X-Data-Version", "Server-Timing", "X-Request-ID"]
          }},
          supports_credentials=True)
 
@@ -127,7 +144,7 @@ def create_app():
 
     
     # Database configuration
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///budget.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
     # JWT configuration
@@ -136,32 +153,125 @@ def create_app():
 
     # Flask-Mail configuration
     app.config['MAIL_SERVER'] = os.getenv("MAIL_SERVER", "smtp.example.com")
-    app.config['MAIL_PORT'] = 587
-    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_PORT'] = int(os.getenv("MAIL_PORT", 587))
+    app.config['MAIL_USE_TLS'] = os.getenv("MAIL_USE_TLS", "true").lower() == "true"
     app.config['MAIL_USE_SSL'] = False
+    app.config['MAIL_USERNAME'] = os.getenv("MAIL_USERNAME")
+    app.config['MAIL_PASSWORD'] = os.getenv("MAIL_PASSWORD")
+    app.config['MAIL_DEFAULT_SENDER'] = os.getenv("MAIL_DEFAULT_SENDER", "noreply@homebudget.local")
 
-    # Initialize extensions
+    # Send queued notification emails from a thread in this process
+    app.config['NOTIFICATION_WORKER'] = os.getenv("NOTIFICATION_WORKER") == "1"
+
+    # Budget summary cache: "lru" (per process) or "redis" (shared)
+    app.config['CACHE_BACKEND'] = os.getenv("CACHE_BACKEND", "lru")
+    app.config['CACHE_REDIS_URL'] = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+    # Password hashing: werkzeug method string and hashing processes per worker
+    # (0 hashes on the request thread; unset shares the cores out over the
+    # gunicorn workers). Changing the method rehashes on login.
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    app.config['PASSWORD_HASH_WORKERS'] = os.getenv("PASSWORD_HASH_WORKERS")
+
+    # Per-request query counting / Server-Timing; statements slower than
+    # SLOW_QUERY_MS are logged, as is any statement repeated N_PLUS_ONE_THRESHOLD
+    # times in one request
+    app.config['QUERY_INSTRUMENTATION'] = os.getenv("QUERY_INSTRUMENTATION", "1") == "1"
+    app.config['SLOW_QUERY_MS'] = float(os.getenv("SLOW_QUERY_MS", 200))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.getenv("N_PLUS_ONE_THRESHOLD", 10))
+
+    # Prometheus metrics at /metrics; under gunicorn, gunicorn.conf.py sets
+    # PROMETHEUS_MULTIPROC_DIR so every worker's numbers are included
+    app.config['METRICS_ENABLED'] = os.getenv("METRICS_ENABLED", "1") == "1"
+
+    # JSON logs written to stderr from a background thread; DEBUG records are
+    # kept for LOG_DEBUG_SAMPLE_RATE of requests
+    app.config['LOG_LEVEL'] = os.getenv("LOG_LEVEL", "INFO")
+    app.config['LOG_DEBUG_SAMPLE_RATE'] = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.1))
+    app.config['LOG_QUEUE_SIZE'] = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+    # Reject oversized bodies from the Content-Length header with a 413, before
+    # Werkzeug parses and spools them; the largest legitimate body is an
+    # image upload plus its multipart framing
+    app.config['MAX_CONTENT_LENGTH'] = MAX_IMAGE_BYTES + 64 * 1024
+
+    # Overrides (benchmarks, local tooling) win over the defaults above
+    if config:
+        app.config.update(config)
+
+    # Pool sizing / timeouts depend on which database we ended up with
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    # Initialize extensions; logging first, so the request id is set before
+    # any other hook can log
+    log_pipeline.init_app(app)
     db.init_app(app)
+    init_engine(app)
+    query_instrumentation.init_app(app)
+    metrics.init_app(app)
     migrate = Migrate(app, db)
     jwt = JWTManager(app)
     mail.init_app(app)
+    blocklist_cache.init_app(app)
+    summary_cache.init_app(app)
+    password_hasher.init_app(app)
+    notification_worker.init_app(app)
 
-    # Token blocklist check
+    # Token blocklist check, answered from the in-process cache where possible
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(_jwt_header, jwt_payload: dict) -> bool:
-        jti = jwt_payload.get("jti")
-        return db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar() is not None
+        return blocklist_cache.is_revoked(jwt_payload.get("jti"))
+
+    @app.route("/blocklist/stats")
+    @jwt_required()
+    def blocklist_stats():
+        return jsonify(blocklist_cache.stats()), 200
+
+    @app.route("/cache/stats")
+    @jwt_required()
+    def cache_stats():
+        return jsonify(summary_cache.stats()), 200
+
+    @app.route("/passwords/stats")
+    @jwt_required()
+    def password_stats():
+        return jsonify(password_hasher.stats()), 200
+
+    @app.route("/queries/stats")
+    @jwt_required()
+    def query_stats():
+        return jsonify(query_instrumentation.stats()), 200
+
+    @app.route("/logs/stats")
+    @jwt_required()
+    def log_stats():
+        return jsonify(log_pipeline.stats()), 200
 
     @app.route("/")
     def home():
         return "Welcome to Home Budget App!", 200
 
+    # MAX_CONTENT_LENGTH applies to every route, so the JSON 413 does too
+    def request_too_large(_error):
+        return jsonify({"error": f"Request body too large; uploads are limited to {MAX_IMAGE_BYTES // (1024 * 1024)} MB"}), 413
+
+    app.register_error_handler(RequestEntityTooLarge, request_too_large)
+
 
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(user_bp)
     app.register_blueprint(budget_bp)
     app.register_blueprint(expense_bp)
+    app.register_blueprint(reports_bp)
+    app.register_blueprint(categories_bp)
+
+    # CLI commands
+    app.cli.add_command(totals_cli)
+    app.cli.add_command(prune_command)
+    app.cli.add_command(forecast_command)
+    app.cli.add_command(notifications_cli)
+    app.cli.add_command(backfill_command)
 
     return app
 
@@ -0,0 +1,65 @@
+"""GET /budgets: SQL query count and latency against the number of budgets.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_budgets
+"""
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import create_app
+from benchmarks.harness import insert_expenses, seed_categories, seed_users, token_for
+from models import db
+
+BUDGET_COUNTS = [1, 10, 40, 100]
+EXPENSES_PER_BUDGET = 20
+REQUESTS = 200
+
+
+def seed(budget_count):
+    [user] = seed_users(1)
+    categories = seed_categories(user, budget_count, limit=1000)
+    insert_expenses(
+        {"category_id": category.id, "amount": 1.5, "date": datetime(2025, 1, 1), "user_id": user.id}
+        for category in categories
+        for _ in range(EXPENSES_PER_BUDGET)
+    )
+    return token_for(user)
+
+
+def run(budget_count):
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    with app.app_context():
+        db.create_all()
+        token = seed(budget_count)
+
+        queries = []
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda *args: queries.append(1))
+
+        client = app.test_client()
+        headers = {"Authorization": f"Bearer {token}"}
+        timings = []
+        for _ in range(REQUESTS):
+            queries.clear()
+            start = time.perf_counter()
+            response = client.get("/budgets", headers=headers)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.get_json()
+
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        return len(queries), statistics.median(timings), p95
+
+
+def main():
+    print(f"{'budgets':>8} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for budget_count in BUDGET_COUNTS:
+        query_count, p50, p95 = run(budget_count)
+        print(f"{budget_count:>8} {query_count:>8} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
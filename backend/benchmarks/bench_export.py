@@ -0,0 +1,79 @@
+"""GET /expenses/export: throughput and peak Python memory for a large history.
+
+Run from the backend directory (the row count defaults to 1,000,000):
+
+    python -m benchmarks.bench_export [rows]
+
+Peak memory is measured with tracemalloc while the response is consumed
+chunk by chunk; it should stay flat as the row count grows.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app import create_app
+from benchmarks.harness import insert_expenses, seed_categories, seed_users, token_for
+from models import db
+
+
+def seed(row_count):
+    [user] = seed_users(1)
+    categories = seed_categories(user, 12)
+
+    # The export reads expense rows only, so the totals aren't rebuilt
+    start = datetime(2020, 1, 1)
+    insert_expenses(({
+        "category_id": categories[i % 12].id,
+        "amount": 12.5,
+        "date": start + timedelta(minutes=i),
+        "user_id": user.id,
+    } for i in range(row_count)), totals=False)
+    return token_for(user)
+
+
+def consume(client, headers, export_format):
+    response = client.get(f"/expenses/export?format={export_format}", headers=headers, buffered=False)
+    size = lines = 0
+    for chunk in response.iter_encoded():
+        size += len(chunk)
+        lines += chunk.count(b"\n")
+    response.close()
+    return lines, size
+
+
+def measure(client, headers, export_format):
+    # Timed and traced separately: tracemalloc slows allocation-heavy code a lot
+    start = time.perf_counter()
+    lines, size = consume(client, headers, export_format)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    consume(client, headers, export_format)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return lines, size, elapsed, peak
+
+
+def main(row_count):
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = "sqlite:///" + os.path.join(tmp, "export.db")
+        app = create_app({"SQLALCHEMY_DATABASE_URI": uri})
+        with app.app_context():
+            db.create_all()
+            token = seed(row_count)
+
+        client = app.test_client()
+        headers = {"Authorization": f"Bearer {token}"}
+        print(f"{'format':>7} {'rows':>10} {'MB out':>8} {'seconds':>8} {'rows/s':>10} {'peak MB':>8}")
+        for export_format in ("ndjson", "csv"):
+            lines, size, elapsed, peak = measure(client, headers, export_format)
+            rows = lines - (export_format == "csv")
+            print(f"{export_format:>7} {rows:>10} {size / 1e6:>8.1f} {elapsed:>8.2f} "
+                  f"{rows / elapsed:>10.0f} {peak / 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,94 @@
+"""POST /login throughput, and the latency of a cheap request during a
+login burst, with password hashing inline vs. in the process pool.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_passwords [concurrency] [logins]
+
+Logins/sec per core divides by the hashing processes actually used (one
+for inline hashing), capped at the machine's core count.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from app import create_app
+from benchmarks.harness import seed_users
+from models import db
+from passwords import password_hasher
+
+PASSWORD = "correct horse battery"
+
+
+def run(workers, concurrency, logins):
+    database = os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+        "PASSWORD_HASH_WORKERS": workers,
+        "PASSWORD_HASH_MAX_PENDING": concurrency,
+        "PASSWORD_HASH_QUEUE_TIMEOUT": 60.0
+    })
+    with app.app_context():
+        db.create_all()
+        seed_users(concurrency, password_hasher.hash(PASSWORD))
+
+    client = app.test_client()
+    # Warm the pool so process start-up isn't billed to the first logins
+    client.post("/login", json={"email": "bench0@example.com", "password": PASSWORD})
+
+    remaining = iter(range(logins))
+    counter_lock = threading.Lock()
+    done = threading.Event()
+
+    def login_loop(i):
+        while True:
+            with counter_lock:
+                if next(remaining, None) is None:
+                    return
+            response = client.post("/login", json={"email": f"bench{i}@example.com", "password": PASSWORD})
+            assert response.status_code == 200, response.get_json()
+
+    def probe_loop(timings):
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get("/")
+            timings.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.005)
+
+    probe_timings = []
+    probe = threading.Thread(target=probe_loop, args=(probe_timings,))
+    threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    probe.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    probe.join()
+
+    stats = password_hasher.stats()
+    password_hasher.shutdown()
+    cores = min(max(workers, 1), os.cpu_count() or 1)
+    rate = logins / elapsed
+    p95 = statistics.quantiles(probe_timings, n=20)[-1] if len(probe_timings) >= 2 else float("nan")
+    return rate, rate / cores, p95, stats["avg_queue_ms"], stats["avg_hash_ms"]
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    logins = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    worker_counts = sorted({0, 1, os.cpu_count() or 1})
+    print(f"method={password_hasher.method} concurrency={concurrency} logins={logins} cores={os.cpu_count()}")
+    print(f"{'workers':>8} {'logins/s':>9} {'per core':>9} {'GET / p95 ms':>13} {'queue ms':>9} {'hash ms':>8}")
+    for workers in worker_counts:
+        rate, per_core, p95, queue_ms, hash_ms = run(workers, concurrency, logins)
+        print(f"{workers:>8} {rate:>9.1f} {per_core:>9.1f} {p95:>13.2f} {queue_ms:>9.2f} {hash_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
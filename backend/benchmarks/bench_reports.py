@@ -0,0 +1,98 @@
+"""GET /reports/*: response times for one user with a large expense history.
+
+Run from the backend directory (the row count defaults to 200,000):
+
+    python -m benchmarks.bench_reports [rows]
+
+For comparison it also times what the frontend used to do: page through
+GET /expenses and add everything up client-side.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app import create_app
+from benchmarks.harness import insert_expenses, seed_categories, seed_users, token_for
+from models import db
+
+REPEATS = 5
+REPORTS = [
+    "/reports/categories",
+    "/reports/categories?from=2021-01-01&to=2021-12-31",
+    "/reports/timeline?granularity=day&from=2021-01-01&to=2021-03-31",
+    "/reports/timeline?granularity=week",
+    "/reports/timeline?granularity=month",
+    "/reports/timeline?granularity=month&split=category",
+    "/reports/top?n=5",
+    "/reports/top?n=5&from=2022-01-01&to=2022-06-30",
+]
+
+
+def seed(row_count):
+    [user] = seed_users(1)
+    categories = seed_categories(user, 12)
+
+    # Spread over roughly three years so day/week/month groups are realistic.
+    # The reports aggregate expense rows directly, so the totals aren't rebuilt
+    start = datetime(2020, 1, 1)
+    step = timedelta(days=3 * 365) / row_count
+    insert_expenses(({
+        "category_id": categories[i % 12].id,
+        "amount": 5 + i % 40,
+        "date": start + step * i,
+        "user_id": user.id,
+    } for i in range(row_count)), totals=False)
+    return token_for(user)
+
+
+def time_get(client, headers, path):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    return statistics.median(timings), len(body["categories"] if isinstance(body, dict) else body)
+
+
+def time_client_side(client, headers):
+    """Download every expense through the paginated listing, as the frontend did"""
+    start = time.perf_counter()
+    totals, cursor, pages = {}, None, 0
+    while True:
+        path = "/expenses?limit=200" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(path, headers=headers)
+        pages += 1
+        for expense in response.get_json():
+            totals[expense["category"]] = totals.get(expense["category"], 0) + expense["amount"]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return time.perf_counter() - start, pages
+
+
+def main(row_count):
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = "sqlite:///" + os.path.join(tmp, "reports.db")
+        app = create_app({"SQLALCHEMY_DATABASE_URI": uri})
+        with app.app_context():
+            db.create_all()
+            token = seed(row_count)
+
+        client = app.test_client()
+        headers = {"Authorization": f"Bearer {token}"}
+        print(f"{row_count} expenses, median of {REPEATS} requests")
+        print(f"{'ms':>9} {'rows':>6}  endpoint")
+        for path in REPORTS:
+            elapsed, rows = time_get(client, headers, path)
+            print(f"{elapsed * 1000:>9.1f} {rows:>6}  {path}")
+
+        elapsed, pages = time_client_side(client, headers)
+        print(f"{elapsed * 1000:>9.1f} {pages:>6}  client-side totals over paginated /expenses (pages)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
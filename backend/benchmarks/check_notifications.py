@@ -0,0 +1,157 @@
+"""Run the notification sender against a local aiosmtpd server and check what
+was delivered, what is retried and how attempts are counted.
+
+Needs the dev requirements (pip install -r requirements-dev.txt). Run from
+the backend directory:
+
+    python -m benchmarks.check_notifications
+
+Exits non-zero if any check fails.
+"""
+import os
+import socket
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from email import message_from_bytes
+
+from aiosmtpd.controller import Controller
+
+from app import create_app
+from benchmarks.harness import seed_users
+from models import db, EmailNotification
+from notifications import MAX_ATTEMPTS, RETRY_BASE_SECONDS, queue_email, send_batch
+
+
+class Inbox:
+    """aiosmtpd handler that keeps every delivered message and refuses
+    recipients listed in `refuse` (address -> how many times, None = always)
+    with a temporary 451 error"""
+
+    def __init__(self):
+        self.messages = []
+        self.refuse = {}
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        remaining = self.refuse.get(address, 0)
+        if remaining is None or remaining > 0:
+            if remaining:
+                self.refuse[address] = remaining - 1
+            return "451 4.3.0 Mailbox temporarily unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, message_from_bytes(envelope.content)))
+        return "250 OK"
+
+    def delivered(self, address):
+        return [message["Subject"] for recipients, message in self.messages if address in recipients]
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def make_due():
+    """Pretend the retry backoff has passed for every pending notification"""
+    EmailNotification.query.filter_by(status="pending").update({"next_attempt_at": datetime.utcnow()})
+    db.session.commit()
+
+
+def notification(address):
+    db.session.expire_all()
+    return EmailNotification.query.filter_by(recipient=address).one()
+
+
+def main():
+    results = []
+
+    def check(description, ok, detail=""):
+        results.append(ok)
+        print(f"[{'ok' if ok else 'FAIL'}] {description}" + (f": {detail}" if detail and not ok else ""))
+
+    inbox = Inbox()
+    port = free_port()
+    smtp = Controller(inbox, hostname="127.0.0.1", port=port)
+    smtp.start()
+
+    tmp = tempfile.TemporaryDirectory()
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tmp.name, "notifications.db"),
+        "MAIL_SERVER": "127.0.0.1",
+        "MAIL_PORT": port,
+        "MAIL_USE_TLS": False,
+        "NOTIFICATION_WORKER": False,
+    })
+    try:
+        with app.app_context():
+            db.create_all()
+            ok_user, flaky_user, dead_user, offline_user = seed_users(4)
+            inbox.refuse = {flaky_user.email: 1, dead_user.email: None}
+            for user in (ok_user, flaky_user, dead_user):
+                queue_email(user, f"Alert for {user.username}", "Your budget has reached its limit.")
+            db.session.commit()
+
+            # First pass: one delivered, two refused
+            before = datetime.utcnow()
+            sent, failed = send_batch()
+            check("first batch sends one and fails two", (sent, failed) == (1, 2), f"{sent} sent, {failed} failed")
+            check("delivered message has the queued subject",
+                  inbox.delivered(ok_user.email) == [f"Alert for {ok_user.username}"], inbox.delivered(ok_user.email))
+            flaky = notification(flaky_user.email)
+            check("refused send is pending with one attempt", (flaky.status, flaky.attempts) == ("pending", 1),
+                  f"{flaky.status}, {flaky.attempts} attempts")
+            delay = (flaky.next_attempt_at - before).total_seconds()
+            check("first retry backs off RETRY_BASE_SECONDS", RETRY_BASE_SECONDS <= delay < RETRY_BASE_SECONDS + 5,
+                  f"{delay:.1f}s")
+            check("refusal is recorded as last_error", "451" in (flaky.last_error or ""), flaky.last_error)
+            check("nothing is sent before the backoff", send_batch() == (0, 0))
+
+            # Retry until nothing is due: flaky gets through, dead runs out of attempts
+            for _ in range(MAX_ATTEMPTS):
+                make_due()
+                send_batch()
+            flaky = notification(flaky_user.email)
+            check("retried send is delivered on the second attempt", (flaky.status, flaky.attempts) == ("sent", 2),
+                  f"{flaky.status}, {flaky.attempts} attempts")
+            check("retried message is delivered once", len(inbox.delivered(flaky_user.email)) == 1,
+                  inbox.delivered(flaky_user.email))
+            dead = notification(dead_user.email)
+            check(f"always-refused send fails after {MAX_ATTEMPTS} attempts",
+                  (dead.status, dead.attempts) == ("failed", MAX_ATTEMPTS), f"{dead.status}, {dead.attempts} attempts")
+            check("sent message is not sent again", len(inbox.delivered(ok_user.email)) == 1,
+                  inbox.delivered(ok_user.email))
+
+            # SMTP server down: the batch is retried once it's back
+            smtp.stop()
+            queue_email(offline_user, "While offline", "Queued while the SMTP server was down.")
+            db.session.commit()
+            sent, failed = send_batch()
+            offline = notification(offline_user.email)
+            check("connection failure counts an attempt and retries",
+                  (sent, failed, offline.status, offline.attempts) == (0, 1, "pending", 1),
+                  f"{sent} sent, {failed} failed, {offline.status}, {offline.attempts} attempts")
+            smtp = Controller(inbox, hostname="127.0.0.1", port=port)
+            smtp.start()
+            make_due()
+            sent, failed = send_batch()
+            offline = notification(offline_user.email)
+            check("queued message goes out once the server is back",
+                  (sent, offline.status, inbox.delivered(offline_user.email)) == (1, "sent", ["While offline"]),
+                  f"{sent} sent, {offline.status}")
+            check("claim lease is released after sending",
+                  offline.claimed_by is None and offline.sent_at is not None
+                  and offline.sent_at > datetime.utcnow() - timedelta(minutes=1))
+    finally:
+        smtp.stop()
+        tmp.cleanup()
+
+    print(f"{sum(results)}/{len(results)} checks passed")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+"""Load-test harness for the hot API endpoints, with JSON output that can be
+diffed between commits.
+
+Seeds a synthetic dataset (users x budgets x expenses) through the models,
+then drives each endpoint either in-process through the Flask test client
+or over HTTP against gunicorn, and records throughput, p50/p95/p99 latency
+and SQL queries per request. Run from the backend directory:
+
+    python -m benchmarks.harness run --output before.json
+    python -m benchmarks.harness run --mode gunicorn --workers 4 --output after.json
+    python -m benchmarks.harness compare before.json after.json
+
+The database (a temporary SQLite file unless --database is given) is wiped
+and reseeded on every run. Queries per request are read from the
+Server-Timing header, so they are missing if QUERY_INSTRUMENTATION is off.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from aggregates import rebuild_totals
+from app import create_app
+from models import db, User, Budget, Category, Expense
+from passwords import password_hasher
+
+PASSWORD = "benchmark-password"
+QUERY_COUNT = re.compile(r'\bdb;[^,]*desc="(\d+) queries"')
+SEED_BATCH_SIZE = 10_000
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed_users(count, password_hash="x"):
+    """Create and commit users bench0@example.com, bench1@example.com, ..."""
+    users = [
+        User(email=f"bench{u}@example.com", username=f"bench{u}", password=password_hash)
+        for u in range(count)
+    ]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+def seed_categories(user, count, limit=None, periods=("lifetime",)):
+    """Create `count` categories for `user`, each with a budget of `limit`
+    (cycling through `periods`) unless limit is None; returns the categories"""
+    categories = [
+        Category(user_id=user.id, name=f"category-{c}", name_key=f"category-{c}")
+        for c in range(count)
+    ]
+    db.session.add_all(categories)
+    db.session.flush()
+    if limit is not None:
+        db.session.add_all([
+            Budget(category_id=category.id, limit=limit, user_id=user.id, period=periods[c % len(periods)])
+            for c, category in enumerate(categories)
+        ])
+    db.session.commit()
+    return categories
+
+
+def insert_expenses(rows, totals=True):
+    """Bulk-insert expense row dicts in batches of SEED_BATCH_SIZE, then
+    rebuild budget_totals and the rollups from them unless totals=False"""
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, SEED_BATCH_SIZE)):
+        db.session.execute(db.insert(Expense), batch)
+        db.session.commit()
+    if totals:
+        rebuild_totals()
+
+
+def token_for(user):
+    return create_access_token(identity=str(user.id), expires_delta=timedelta(days=1))
+
+
+def seed(users, budgets, expenses):
+    """Create `users` users, each with `budgets` budgets holding `expenses`
+    expenses; returns one dict per user with its credentials and category ids"""
+    seeded = []
+    rows = []
+    start = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    for user in seed_users(users, password_hasher.hash(PASSWORD)):
+        # Limits high enough that create_expense never hits them
+        categories = seed_categories(user, budgets, 10_000_000, ("lifetime", "monthly", "weekly"))
+        for category in categories:
+            rows.extend({
+                "category_id": category.id,
+                "amount": rng.randint(100, 10_000) / 100,
+                "date": start + timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+                "user_id": user.id,
+            } for _ in range(expenses))
+        seeded.append({
+            "email": user.email,
+            "token": token_for(user),
+            "category_ids": [category.id for category in categories],
+        })
+    insert_expenses(rows)
+    return seeded
+
+
+# Endpoint name -> builds (method, path, json body, use auth token) for the
+# i-th request as one of the seeded users
+SCENARIOS = {
+    "get_budgets": lambda account, i: ("GET", "/budgets", None, True),
+    "create_expense": lambda account, i: ("POST", "/expense", {
+        "amount": 1.25,
+        "category_id": account["category_ids"][i % len(account["category_ids"])],
+        "date": (datetime(2025, 1, 1) + timedelta(days=i % 365)).strftime("%Y-%m-%d"),
+    }, True),
+    "login": lambda account, i: ("POST", "/login", {"email": account["email"], "password": PASSWORD}, False),
+}
+
+
+def summarize(timings, errors, elapsed, queries):
+    """Throughput, latency percentiles (ms) and queries per request for one endpoint"""
+    result = {
+        "requests": len(timings),
+        "errors": errors,
+        "throughput_rps": round(len(timings) / elapsed, 2) if elapsed else None,
+        "latency_ms": None,
+        "queries_per_request": None,
+    }
+    if len(timings) >= 2:
+        cuts = statistics.quantiles(timings, n=100, method="inclusive")
+        result["latency_ms"] = {
+            "mean": round(statistics.fmean(timings), 3),
+            "p50": round(cuts[49], 3),
+            "p95": round(cuts[94], 3),
+            "p99": round(cuts[98], 3),
+            "max": round(max(timings), 3),
+        }
+    if queries:
+        result["queries_per_request"] = {
+            "mean": round(statistics.fmean(queries), 2),
+            "max": max(queries),
+        }
+    return result
+
+
+def drive(send, accounts, requests, concurrency, warmup):
+    """Call send(account, i) for `requests` requests (after `warmup`
+    unrecorded ones) from `concurrency` threads; returns (timings in ms,
+    error count, seconds, per-request query counts)"""
+    for i in range(warmup):
+        send(accounts[i % len(accounts)], i)
+
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    timings, queries = [], []
+    errors = 0
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            status, query_count = send(accounts[i % len(accounts)], warmup + i)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                timings.append(elapsed)
+                if query_count is not None:
+                    queries.append(query_count)
+                if status >= 400:
+                    errors += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors, time.perf_counter() - start, queries
+
+
+def query_count(server_timing):
+    """Statement count from the app's `db;dur=..;desc="N queries"` Server-Timing entry"""
+    match = QUERY_COUNT.search(server_timing or "")
+    return int(match.group(1)) if match else None
+
+
+def client_sender(app):
+    """In-process sender through the Flask test client"""
+    client = app.test_client()
+
+    def send(method, path, body, token):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, query_count(response.headers.get("Server-Timing"))
+
+    return send
+
+
+def http_sender(port):
+    """Sender for a server on localhost, opening a fresh connection per
+    request the way independent clients would"""
+    def send(method, path, body, token):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        try:
+            connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, query_count(response.getheader("Server-Timing"))
+        finally:
+            connection.close()
+
+    return send
+
+
+def start_gunicorn(uri, workers, threads):
+    """Serve app:app from gunicorn on a free port; returns (process, port)"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    env = dict(os.environ, DATABASE_URL=uri)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--threads", str(threads),
+         "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"],
+        cwd=BACKEND_DIR, env=env
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during start-up")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start listening within 60 seconds")
+
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--", "."], cwd=BACKEND_DIR, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run(args):
+    tmp = tempfile.TemporaryDirectory()
+    uri = args.database or "sqlite:///" + os.path.join(tmp.name, "harness.db")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": uri})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        accounts = seed(args.users, args.budgets, args.expenses)
+
+    process = None
+    if args.mode == "gunicorn":
+        process, port = start_gunicorn(uri, args.workers, args.threads)
+        raw_send = http_sender(port)
+    else:
+        raw_send = client_sender(app)
+
+    results = {}
+    try:
+        for name in args.endpoints:
+            def send(account, i, scenario=SCENARIOS[name]):
+                method, path, body, auth = scenario(account, i)
+                return raw_send(method, path, body, account["token"] if auth else None)
+
+            requests = args.login_requests if name == "login" else args.requests
+            timings, errors, elapsed, queries = drive(send, accounts, requests, args.concurrency, args.warmup)
+            results[name] = summarize(timings, errors, elapsed, queries)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        password_hasher.shutdown()
+        tmp.cleanup()
+
+    commit, dirty = git_revision()
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": "sqlite (temporary)" if not args.database else args.database.split(":", 1)[0],
+            "mode": args.mode,
+            "workers": args.workers if args.mode == "gunicorn" else None,
+            "threads": args.threads if args.mode == "gunicorn" else None,
+            "concurrency": args.concurrency,
+            "dataset": {"users": args.users, "budgets_per_user": args.budgets, "expenses_per_budget": args.expenses},
+        },
+        "endpoints": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(text + "\n")
+    print(text)
+
+
+# (label, path into an endpoint's result, whether higher is better)
+COMPARED_METRICS = [
+    ("rps", ("throughput_rps",), True),
+    ("p50 ms", ("latency_ms", "p50"), False),
+    ("p95 ms", ("latency_ms", "p95"), False),
+    ("p99 ms", ("latency_ms", "p99"), False),
+    ("queries", ("queries_per_request", "mean"), False),
+]
+
+
+def metric(result, path):
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+def compare(args):
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    for label in ("mode", "dataset", "cpu_count"):
+        if before["meta"].get(label) != after["meta"].get(label):
+            print(f"warning: runs differ in {label}: {before['meta'].get(label)} vs {after['meta'].get(label)}")
+    print(f"before {before['meta'].get('commit')}  after {after['meta'].get('commit')}")
+    print(f"{'endpoint':<16} {'metric':<8} {'before':>10} {'after':>10} {'change':>8}")
+
+    regressions = []
+    for name in sorted(set(before["endpoints"]) & set(after["endpoints"])):
+        for label, path, higher_is_better in COMPARED_METRICS:
+            old, new = metric(before["endpoints"][name], path), metric(after["endpoints"][name], path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            worse = -change if higher_is_better else change
+            flag = ""
+            if args.fail_over is not None and worse > args.fail_over:
+                flag = "  <- regression"
+                regressions.append((name, label))
+            print(f"{name:<16} {label:<8} {old:>10.2f} {new:>10.2f} {change:>+7.1f}%{flag}")
+
+    if regressions:
+        raise SystemExit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="seed a dataset and benchmark the endpoints")
+    run_parser.add_argument("--mode", choices=("client", "gunicorn"), default="client")
+    run_parser.add_argument("--users", type=int, default=20)
+    run_parser.add_argument("--budgets", type=int, default=10, help="budgets per user")
+    run_parser.add_argument("--expenses", type=int, default=50, help="expenses per budget")
+    run_parser.add_argument("--requests", type=int, default=300, help="recorded requests per endpoint")
+    run_parser.add_argument("--login-requests", type=int, default=40,
+                            help="recorded logins (each one hashes a password)")
+    run_parser.add_argument("--warmup", type=int, default=10)
+    run_parser.add_argument("--concurrency", type=int, default=4, help="load generator threads")
+    run_parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    run_parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    run_parser.add_argument("--endpoints", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    run_parser.add_argument("--database", help="database URI to use instead of a temporary SQLite file (wiped!)")
+    run_parser.add_argument("--output", help="also write the JSON report to this file")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="diff two JSON reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--fail-over", type=float, metavar="PERCENT",
+                                help="exit non-zero if any metric got this much worse")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
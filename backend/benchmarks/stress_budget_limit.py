@@ -0,0 +1,77 @@
+"""Fire parallel POST /expense requests at one budget and check it is never overspent.
+
+Run from the backend directory, optionally against another database:
+
+    python -m benchmarks.stress_budget_limit [threads] [requests] [database-uri]
+
+The budget allows exactly half of the requests to succeed. Exits non-zero
+if more succeed, or if the stored expenses exceed the limit.
+"""
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+from app import create_app
+from benchmarks.harness import seed_categories, seed_users, token_for
+from models import db, Expense
+
+AMOUNT = 10.0
+
+
+def main(threads=16, requests=400, uri=None):
+    tmp = tempfile.TemporaryDirectory()
+    uri = uri or "sqlite:///" + os.path.join(tmp.name, "stress.db")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": uri})
+    limit = AMOUNT * requests / 2
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        [user] = seed_users(1)
+        [category] = seed_categories(user, 1, limit=limit)
+        category_id = category.id
+        token = token_for(user)
+
+    statuses = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(count):
+        client = app.test_client()
+        headers = {"Authorization": f"Bearer {token}"}
+        barrier.wait()
+        for _ in range(count):
+            response = client.post("/expense", headers=headers, json={
+                "amount": AMOUNT, "category_id": category_id, "date": "2025-01-01"
+            })
+            with lock:
+                statuses[response.status_code] += 1
+
+    per_thread = [requests // threads + (i < requests % threads) for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(count,)) for count in per_thread]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    with app.app_context():
+        stored = db.session.query(db.func.sum(Expense.amount)).scalar() or 0.0
+        db.drop_all()
+    tmp.cleanup()
+
+    print(f"threads={threads} requests={requests} limit={limit:.2f}")
+    print(f"statuses={dict(statuses)} stored_total={stored:.2f}")
+    overspent = stored > limit or statuses[201] * AMOUNT > limit
+    print("FAIL: budget overspent" if overspent else "ok: limit held")
+    return 1 if overspent else 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(main(
+        int(args[0]) if len(args) > 0 else 16,
+        int(args[1]) if len(args) > 1 else 400,
+        args[2] if len(args) > 2 else None
+    ))
@@ -0,0 +1,192 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import click
+from models import db, TokenBlocklist
+from metrics import cache_events
+
+# Longest lifetime of any token we issue (registration hands out 1-day tokens).
+# Rows logged before expires_at existed are pruned once they are this old.
+MAX_TOKEN_LIFETIME = timedelta(days=1)
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings; no false negatives"""
+
+    def __init__(self, size_bits=1 << 20, hash_count=4):
+        self.size_bits = size_bits
+        self.hash_count = hash_count
+        self.bits = bytearray(size_bits // 8)
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8 * self.hash_count).digest()
+        for i in range(self.hash_count):
+            yield int.from_bytes(digest[i * 8:(i + 1) * 8], "little") % self.size_bits
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key):
+        return all(self.bits[p // 8] & (1 << (p % 8)) for p in self.positions(key))
+
+
+class BlocklistCache:
+    """In-process cache in front of the token_blocklist lookup.
+
+    A bloom filter holds every revoked JTI, so most tokens are answered as
+    "definitely not revoked" without a query. Bloom positives fall through
+    to a bounded LRU of recent answers, and only then to the database. JTIs
+    revoked by other worker processes are pulled in by a cheap incremental
+    query at most every BLOCKLIST_REFRESH_SECONDS. Until that refresh, this
+    worker can still accept a token revoked elsewhere.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.bloom = BloomFilter()
+        self.entries = OrderedDict()
+        self.max_entries = 10000
+        self.ttl = 3600.0
+        self.refresh_interval = 5.0
+        self.last_refresh = None
+        self.last_rebuild = None
+        self.last_seen_id = 0
+        self.refreshing = False
+        self.revoked_during_rebuild = None
+        self.counters = {"hits": 0, "misses": 0, "bloom_negatives": 0, "refreshes": 0, "rebuilds": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("BLOCKLIST_CACHE_SIZE", 10000)
+        self.ttl = app.config["JWT_ACCESS_TOKEN_EXPIRES"].total_seconds()
+        self.refresh_interval = app.config.get("BLOCKLIST_REFRESH_SECONDS", 5.0)
+        app.extensions["blocklist_cache"] = self
+
+    def count(self, counter):
+        # Callers hold self.lock
+        self.counters[counter] += 1
+        cache_events.labels("blocklist", counter).inc()
+
+    def refresh(self):
+        """Add JTIs revoked since the last refresh (by any process) to the
+        filter. The query and any rebuild run without holding self.lock;
+        only swapping the results in does, so lookups never wait on it."""
+        now = time.monotonic()
+        with self.lock:
+            if self.refreshing or (self.last_refresh is not None and now - self.last_refresh < self.refresh_interval):
+                return
+            self.refreshing = True
+            self.last_refresh = now
+            self.count("refreshes")
+            # Start over once per token lifetime so pruned JTIs leave the filter
+            # and its false-positive rate doesn't creep up over months
+            rebuild = self.last_rebuild is None or now - self.last_rebuild >= self.ttl
+            if rebuild:
+                self.last_rebuild = now
+                self.count("rebuilds")
+                self.revoked_during_rebuild = []
+            since = 0 if rebuild else self.last_seen_id
+
+        try:
+            rows = db.session.query(TokenBlocklist.id, TokenBlocklist.jti).filter(
+                TokenBlocklist.id > since
+            ).order_by(TokenBlocklist.id).all()
+            if rebuild:
+                bloom = BloomFilter()
+                for _, jti in rows:
+                    bloom.add(jti)
+        except Exception:
+            with self.lock:
+                self.refreshing = False
+                self.revoked_during_rebuild = None
+            raise
+
+        with self.lock:
+            self.refreshing = False
+            if rebuild:
+                # revoke() calls made while the rows loaded went into the old filter
+                for jti in self.revoked_during_rebuild:
+                    bloom.add(jti)
+                self.revoked_during_rebuild = None
+                self.bloom = bloom
+            for row_id, jti in rows:
+                if not rebuild:
+                    self.bloom.add(jti)
+                if jti in self.entries:
+                    self.store(jti, True)
+            self.last_seen_id = rows[-1][0] if rows else since
+
+    def store(self, jti, revoked):
+        self.entries[jti] = (revoked, time.monotonic() + self.ttl)
+        self.entries.move_to_end(jti)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def is_revoked(self, jti):
+        self.refresh()
+        with self.lock:
+            if jti not in self.bloom:
+                self.count("bloom_negatives")
+                return False
+
+            cached = self.entries.get(jti)
+            if cached and cached[1] > time.monotonic():
+                self.entries.move_to_end(jti)
+                self.count("hits")
+                return cached[0]
+
+            self.count("misses")
+
+        revoked = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar() is not None
+        with self.lock:
+            # A concurrent revoke() wins over a stale "not revoked" answer
+            cached = self.entries.get(jti)
+            if not (cached and cached[0]):
+                self.store(jti, revoked)
+        return revoked
+
+    def revoke(self, jti):
+        """Record a logout from this process immediately"""
+        with self.lock:
+            self.bloom.add(jti)
+            if self.revoked_during_rebuild is not None:
+                self.revoked_during_rebuild.append(jti)
+            self.store(jti, True)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, entries=len(self.entries))
+
+
+blocklist_cache = BlocklistCache()
+
+
+def prune_expired(batch_size=1000, now=None):
+    """Delete blocklist rows whose token has expired, one bounded batch per
+    transaction; returns the number of rows deleted"""
+    now = now or datetime.utcnow()
+    expired = db.or_(
+        TokenBlocklist.expires_at < now,
+        db.and_(TokenBlocklist.expires_at.is_(None), TokenBlocklist.created_at < now - MAX_TOKEN_LIFETIME)
+    )
+
+    deleted = 0
+    while True:
+        ids = [row_id for row_id, in db.session.query(TokenBlocklist.id).filter(expired).limit(batch_size)]
+        if not ids:
+            return deleted
+        TokenBlocklist.query.filter(TokenBlocklist.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+
+
+@click.command("blocklist-prune")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows deleted per transaction.")
+def prune_command(batch_size):
+    """Delete token_blocklist rows for tokens that have expired."""
+    deleted = prune_expired(batch_size)
+    click.echo(f"Pruned {deleted} expired blocklist entries.")
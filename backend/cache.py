@@ -0,0 +1,146 @@
+import json
+import threading
+from collections import OrderedDict
+from metrics import cache_events
+from money import MoneyJSONProvider
+
+
+class LRUBackend:
+    """In-process store: one dict of cached responses per user, least
+    recently used users evicted first"""
+    name = "lru"
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self.lock = threading.Lock()
+        self.users = OrderedDict()
+
+    def get(self, user_id, key):
+        with self.lock:
+            entries = self.users.get(user_id)
+            if entries is None:
+                return None
+            self.users.move_to_end(user_id)
+            return entries.get(key)
+
+    def set(self, user_id, key, entry):
+        with self.lock:
+            self.users.setdefault(user_id, {})[key] = entry
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+
+    def delete(self, user_id):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def size(self):
+        with self.lock:
+            return len(self.users)
+
+
+class RedisBackend:
+    """Shared store: one Redis hash per user, so invalidating a user is a
+    single DEL. Works with any redis-py compatible client (fakeredis too)."""
+    name = "redis"
+
+    def __init__(self, client, ttl=3600, prefix="budget-cache:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, user_id, key):
+        raw = self.client.hget(f"{self.prefix}{user_id}", key)
+        return None if raw is None else tuple(json.loads(raw))
+
+    def set(self, user_id, key, entry):
+        pipe = self.client.pipeline()
+        pipe.hset(f"{self.prefix}{user_id}", key, json.dumps(entry, default=MoneyJSONProvider.default))
+        pipe.expire(f"{self.prefix}{user_id}", self.ttl)
+        pipe.execute()
+
+    def delete(self, user_id):
+        self.client.delete(f"{self.prefix}{user_id}")
+
+    def size(self):
+        return sum(1 for _ in self.client.scan_iter(f"{self.prefix}*"))
+
+
+class SummaryCache:
+    """Per-user cache of computed budget summaries.
+
+    Write paths call invalidate(user_id) after they commit. Each entry also
+    records the user's data_version it was built from and is ignored once
+    the version moves on, so a write handled by another worker process
+    can't leave this process serving stale data from its LRU.
+
+    CACHE_BACKEND selects "lru" (default) or "redis"; the Redis client comes
+    from CACHE_REDIS_CLIENT (e.g. a fakeredis instance) or CACHE_REDIS_URL.
+    """
+
+    def __init__(self, app=None):
+        self.backend = LRUBackend()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config.get("CACHE_BACKEND", "lru") == "redis":
+            client = app.config.get("CACHE_REDIS_CLIENT")
+            if client is None:
+                try:
+                    import redis
+                except ImportError:
+                    raise RuntimeError("CACHE_BACKEND=redis needs the redis package installed")
+                client = redis.Redis.from_url(app.config.get("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+            self.backend = RedisBackend(client, ttl=app.config.get("CACHE_TTL_SECONDS", 3600))
+        else:
+            self.backend = LRUBackend(app.config.get("CACHE_MAX_USERS", 10000))
+        app.extensions["summary_cache"] = self
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+        cache_events.labels("summary", counter).inc()
+
+    def get(self, user_id, key, version):
+        """The cached value, or None if missing or built from an older version"""
+        entry = self.backend.get(int(user_id), key)
+        if entry is None:
+            self.count("misses")
+            return None
+        if entry[0] != version:
+            self.count("stale")
+            return None
+        self.count("hits")
+        return entry[1]
+
+    def set(self, user_id, key, version, value):
+        self.backend.set(int(user_id), key, (version, value))
+        return value
+
+    def get_or_build(self, user_id, key, version, build):
+        value = self.get(user_id, key, version)
+        if value is None:
+            value = self.set(user_id, key, version, build())
+        return value
+
+    def invalidate(self, user_id):
+        """Drop everything cached for a user; call after committing a write"""
+        self.backend.delete(int(user_id))
+        self.count("invalidations")
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"] + counters["stale"]
+        return dict(
+            counters,
+            backend=self.backend.name,
+            users=self.backend.size(),
+            hit_ratio=round(counters["hits"] / lookups, 4) if lookups else None
+        )
+
+
+summary_cache = SummaryCache()
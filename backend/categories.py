@@ -0,0 +1,74 @@
+from sqlalchemy.exc import IntegrityError
+from models import db, Category
+
+
+def category_id_select(user_id, name):
+    """Scalar subquery for the id of the user's category called `name`
+    (NULL if there is none), for filtering by name in one query"""
+    return db.select(Category.id).where(
+        Category.user_id == int(user_id),
+        Category.name_key == Category.key(name)
+    ).scalar_subquery()
+
+
+def find_category(user_id, name):
+    """The user's category matching `name` regardless of case and spacing, or None"""
+    return Category.query.filter_by(user_id=int(user_id), name_key=Category.key(name)).first()
+
+
+def get_or_create_category(user_id, name):
+    """The user's category matching `name`, created if it doesn't exist yet.
+    Two requests creating the same category race on the unique name_key;
+    the loser picks up the winner's row."""
+    name = " ".join(str(name).split())
+    if not name:
+        raise ValueError("Category name must not be empty")
+    if len(name) > 100:
+        raise ValueError("Category name must be at most 100 characters")
+
+    category = find_category(user_id, name)
+    if category:
+        return category
+    try:
+        with db.session.begin_nested():
+            category = Category(user_id=int(user_id), name=name, name_key=Category.key(name))
+            db.session.add(category)
+    except IntegrityError:
+        category = find_category(user_id, name)
+    return category
+
+
+def resolve_category(user_id, data, create=False):
+    """The category a request refers to, by `category_id` or, for callers
+    that still send names, by `category`. Returns None for an unknown name
+    unless `create` is set; raises ValueError for a bad or foreign id."""
+    if data.get("category_id") is not None:
+        try:
+            category_id = int(data["category_id"])
+        except (TypeError, ValueError):
+            raise ValueError("category_id must be an integer")
+        category = db.session.get(Category, category_id)
+        if not category or category.user_id != int(user_id):
+            raise ValueError(f"No category with id {category_id}")
+        return category
+    if create:
+        return get_or_create_category(user_id, data["category"])
+    return find_category(user_id, data["category"])
+
+
+def resolve_categories(user_id, refs):
+    """Map each ref (an int category id or a str name) to the user's
+    Category, in at most two queries; unknown refs are left out"""
+    ids = {ref for ref in refs if isinstance(ref, int)}
+    names = {}
+    for ref in refs:
+        if not isinstance(ref, int):
+            names.setdefault(Category.key(ref), []).append(ref)
+    resolved = {}
+    if ids:
+        for category in Category.query.filter(Category.user_id == int(user_id), Category.id.in_(ids)):
+            resolved[category.id] = category
+    if names:
+        for category in Category.query.filter(Category.user_id == int(user_id), Category.name_key.in_(names)):
+            resolved.update(dict.fromkeys(names[category.name_key], category))
+    return resolved
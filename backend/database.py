@@ -0,0 +1,52 @@
+import os
+from sqlalchemy import event
+from models import db
+
+
+def database_uri():
+    """DATABASE_URL from the environment, defaulting to the local SQLite file"""
+    uri = os.getenv("DATABASE_URL", "sqlite:///budget.db")
+    # Hosted Postgres often hands out postgres://, which SQLAlchemy 2 rejects
+    if uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql://", 1)
+    return uri
+
+
+def engine_options(uri):
+    """SQLAlchemy engine options for the given database, tunable via env vars"""
+    if uri.startswith("sqlite"):
+        return {}
+
+    options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
+    if uri.startswith("postgresql"):
+        timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 5000))
+        options["connect_args"] = {"options": f"-c statement_timeout={timeout_ms}"}
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, _connection_record, busy_timeout_ms):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers carry on while a writer commits, so gunicorn workers
+    # stop queueing behind each other on the database lock
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    cursor.close()
+
+
+def init_engine(app):
+    """Attach per-connection setup to the app's engine; call after db.init_app"""
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == "sqlite":
+            busy_timeout_ms = app.config.get("SQLITE_BUSY_TIMEOUT_MS", 5000)
+            event.listen(
+                engine, "connect",
+                lambda conn, record: set_sqlite_pragmas(conn, record, busy_timeout_ms)
+            )
@@ -0,0 +1,171 @@
+import click
+import numpy as np
+from datetime import datetime, timedelta
+from decimal import Decimal
+from models import db, Budget, BudgetTotal, SpendingRollup
+from aggregates import as_day
+from money import CENT
+
+MOVING_AVERAGE_DAYS = (7, 30)
+
+# Lifetime budgets have no period end; don't project exceed dates past this
+FORECAST_HORIZON_DAYS = 365
+
+
+def load_budgets(user_id=None):
+    """Budgets (one user's, or everyone's) ordered by id, with their lifetime
+    totals in cents"""
+    query = db.session.query(
+        Budget,
+        db.func.coalesce(db.type_coerce(BudgetTotal.total, db.BigInteger), 0)
+    ).outerjoin(
+        BudgetTotal,
+        db.and_(BudgetTotal.user_id == Budget.user_id, BudgetTotal.category_id == Budget.category_id)
+    )
+    if user_id is not None:
+        query = query.filter(Budget.user_id == user_id)
+    rows = query.order_by(Budget.id).all()
+    return [budget for budget, _ in rows], np.array([total for _, total in rows], dtype=np.int64)
+
+
+def period_offsets(budgets, day):
+    """Start (inclusive) and end (exclusive) of each budget's current period,
+    in days relative to `day`; NaN for lifetime budgets"""
+    starts = np.full(len(budgets), np.nan)
+    ends = np.full(len(budgets), np.nan)
+    for i, budget in enumerate(budgets):
+        start, end = budget.period_bounds(day)
+        if start is not None:
+            starts[i] = (start - day).days
+            ends[i] = (end - day).days
+    return starts, ends
+
+
+def load_daily_totals(since, day, user_id=None):
+    """Day rollups from `since` to `day` for every budgeted category, as
+    parallel arrays of (budget id, day offset from `day`, cents)"""
+    query = db.session.query(
+        Budget.id,
+        SpendingRollup.period_start,
+        db.type_coerce(SpendingRollup.total, db.BigInteger)
+    ).join(
+        SpendingRollup,
+        db.and_(SpendingRollup.user_id == Budget.user_id, SpendingRollup.category_id == Budget.category_id)
+    ).filter(
+        SpendingRollup.granularity == "day",
+        SpendingRollup.period_start >= since,
+        SpendingRollup.period_start <= day
+    )
+    if user_id is not None:
+        query = query.filter(Budget.user_id == user_id)
+    rows = query.all()
+
+    budget_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    days = np.array([row[1] for row in rows], dtype="datetime64[D]")
+    offsets = (days - np.datetime64(day, "D")).astype(np.int64)
+    cents = np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows))
+    return budget_ids, offsets, cents
+
+
+def sum_by_budget(row_budgets, cents, count):
+    """Exact int64 sum of `cents` per budget position (np.bincount would add
+    them up as float64)"""
+    totals = np.zeros(count, dtype=np.int64)
+    np.add.at(totals, row_budgets, cents)
+    return totals
+
+
+def project(limits, lifetime_spent, starts, ends, row_budgets, row_offsets, row_cents):
+    """Vectorized burn-rate projection for every budget at once; all money
+    in integer cents, except the rates and projections derived from them.
+    Rows are day totals indexed by budget position."""
+    count = len(limits)
+    lifetime = np.isnan(starts)
+
+    # Comparisons against NaN are False, so lifetime rows drop out here
+    with np.errstate(invalid="ignore"):
+        in_period = row_offsets >= starts[row_budgets]
+    spent = np.where(
+        lifetime,
+        lifetime_spent,
+        sum_by_budget(row_budgets, row_cents * in_period, count)
+    )
+    moving_averages = {
+        days: sum_by_budget(row_budgets, row_cents * (row_offsets > -days), count) / days
+        for days in MOVING_AVERAGE_DAYS
+    }
+
+    # Periodic budgets burn at their period-to-date rate; lifetime ones at
+    # the trailing 30-day average
+    elapsed_days = 1 - starts
+    burn_rate = np.where(lifetime, moving_averages[30], spent / np.where(lifetime, 1, elapsed_days))
+    remaining_days = np.where(lifetime, FORECAST_HORIZON_DAYS, ends - 1)
+    projected = np.where(lifetime, np.nan, spent + burn_rate * remaining_days)
+
+    # First day on which spending goes over the limit (0 = already over)
+    headroom = limits - spent
+    days_to_exceed = np.full(count, np.inf)
+    np.floor_divide(headroom, burn_rate, out=days_to_exceed, where=burn_rate > 0)
+    days_to_exceed = np.where(headroom < 0, 0, days_to_exceed + 1)
+    exceeds = days_to_exceed <= remaining_days
+
+    return {
+        "spent": spent,
+        "burn_rate": burn_rate,
+        "moving_averages": moving_averages,
+        "projected": projected,
+        "days_to_exceed": np.where(exceeds, days_to_exceed, np.nan),
+    }
+
+
+def forecast_budgets(user_id=None, day=None):
+    """Burn rate, moving averages and projected period-end spend for one
+    user's budgets, or for every user's when `user_id` is None, computed in
+    one vectorized pass over the day rollups"""
+    day = as_day(day or datetime.utcnow().date())
+    budgets, lifetime_spent = load_budgets(user_id)
+    if not budgets:
+        return []
+
+    starts, ends = period_offsets(budgets, day)
+    lookback = min(np.nanmin(starts, initial=0), 1 - max(MOVING_AVERAGE_DAYS))
+    row_ids, row_offsets, row_cents = load_daily_totals(day + timedelta(days=int(lookback)), day, user_id)
+
+    ids = np.array([budget.id for budget in budgets], dtype=np.int64)
+    limits = np.array([int(budget.limit * 100) for budget in budgets], dtype=np.int64)
+    result = project(limits, lifetime_spent, starts, ends,
+                     np.searchsorted(ids, row_ids), row_offsets, row_cents)
+
+    def money(cents):
+        """(Fractional) cents back to a 2-place Decimal, as Cents columns load"""
+        return None if np.isnan(cents) else (Decimal(int(np.rint(cents))) / 100).quantize(CENT)
+
+    forecasts = []
+    for i, budget in enumerate(budgets):
+        days_to_exceed = result["days_to_exceed"][i]
+        forecasts.append({
+            "id": budget.id,
+            "user_id": budget.user_id,
+            "category": budget.category,
+            "period": budget.period,
+            "limit": budget.limit,
+            "spent": money(result["spent"][i]),
+            "period_end": None if np.isnan(ends[i]) else (day + timedelta(days=int(ends[i]) - 1)).strftime("%Y-%m-%d"),
+            "burn_rate": money(result["burn_rate"][i]),
+            **{f"moving_avg_{days}d": money(result["moving_averages"][days][i]) for days in MOVING_AVERAGE_DAYS},
+            "projected": money(result["projected"][i]),
+            "exceeds_on": None if np.isnan(days_to_exceed) else (day + timedelta(days=int(days_to_exceed))).strftime("%Y-%m-%d"),
+        })
+    return forecasts
+
+
+@click.command("forecast-budgets")
+@click.option("--user-id", type=int, help="Only score this user's budgets.")
+def forecast_command(user_id):
+    """Score budgets and list the ones projected to go over their limit."""
+    forecasts = forecast_budgets(user_id)
+    at_risk = [f for f in forecasts if f["exceeds_on"]]
+    for f in at_risk:
+        click.echo(f"user {f['user_id']} / {f['category']}: spent {f['spent']:.2f} of {f['limit']:.2f}, "
+                   f"exceeds on {f['exceeds_on']}")
+    click.echo(f"Scored {len(forecasts)} budgets, {len(at_risk)} projected to exceed their limit.")
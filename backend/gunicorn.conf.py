@@ -0,0 +1,32 @@
+"""gunicorn settings picked up automatically when gunicorn runs from this
+directory (gunicorn app:app). Anything set on the command line wins.
+
+The worker count is exported as WEB_CONCURRENCY, which the password
+hasher divides the cores by.
+
+Prometheus metrics from all workers are aggregated through files in
+PROMETHEUS_MULTIPROC_DIR; it has to be set before the workers import the
+app, and emptied on start-up so a restart doesn't inherit old counts.
+"""
+import os
+import shutil
+import tempfile
+
+# Before anything imports prometheus_client: it picks its storage at import time
+multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "homebudget-metrics")
+)
+
+
+def on_starting(server):
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+    # Lets each worker size its password hashing pool to its share of the cores
+    os.environ["WEB_CONCURRENCY"] = str(server.cfg.workers)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # Drop the dead worker's live gauges (in-flight requests, pool usage)
+    multiprocess.mark_process_dead(worker.pid)
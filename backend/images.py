@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import click
+from PIL import Image, ImageOps, UnidentifiedImageError
+from models import db, Budget
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = "uploads/budget_images"
+VARIANT_FOLDER = os.path.join(UPLOAD_FOLDER, "variants")
+
+CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# Pillow format -> (extension, mimetype) of the originals we accept
+IMAGE_FORMATS = {"PNG": ("png", "image/png"), "JPEG": ("jpg", "image/jpeg")}
+
+# WebP variants generated for every upload: name -> longest side in pixels
+VARIANTS = {"thumb": 160, "card": 640}
+WEBP_QUALITY = 80
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# Resizing is CPU-bound Pillow work; keep it off the request threads
+variant_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-variants")
+
+
+def image_url(digest, variant="card"):
+    return f"/budgets/images/{digest}/{variant}"
+
+
+def detect_format(path):
+    """Pillow format name of an image file; raises ValueError for anything
+    that isn't a valid PNG or JPEG"""
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise ValueError("File is not a valid image")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError("Only PNG and JPEG images are supported")
+    return image_format
+
+
+def original_path(digest):
+    """(path, mimetype) of the stored original for `digest`, or (None, None)"""
+    for extension, mimetype in IMAGE_FORMATS.values():
+        path = os.path.join(UPLOAD_FOLDER, f"{digest}.{extension}")
+        if os.path.exists(path):
+            return path, mimetype
+    return None, None
+
+
+def variant_path(digest, variant):
+    return os.path.join(VARIANT_FOLDER, f"{digest}-{variant}.webp")
+
+
+def store_image(stream, max_bytes=MAX_IMAGE_BYTES):
+    """Copy an upload to disk CHUNK_SIZE bytes at a time, hashing as it goes,
+    and file it under its SHA-256; returns (digest, path). Identical uploads
+    share one stored file."""
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_FOLDER, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Images must be {max_bytes // (1024 * 1024)} MB or smaller")
+                digest.update(chunk)
+                out.write(chunk)
+
+        extension = IMAGE_FORMATS[detect_format(temp_path)][0]
+        digest = digest.hexdigest()
+        path = os.path.join(UPLOAD_FOLDER, f"{digest}.{extension}")
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+        return digest, path
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def generate_variants(digest, path):
+    """Write the WebP variants for a stored original, skipping any that exist"""
+    os.makedirs(VARIANT_FOLDER, exist_ok=True)
+    for variant, size in VARIANTS.items():
+        target = variant_path(digest, variant)
+        if os.path.exists(target):
+            continue
+        try:
+            with Image.open(path) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((size, size))
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+                # Write under a temporary name so readers never see half a file
+                temp_path = f"{target}.{os.getpid()}.part"
+                image.save(temp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(temp_path, target)
+        except Exception:
+            logger.exception("Could not generate %s variant for image %s", variant, digest)
+
+
+def schedule_variants(digest, path):
+    """Generate the variants in the background; until they exist the original is served"""
+    if all(os.path.exists(variant_path(digest, variant)) for variant in VARIANTS):
+        return None
+    return variant_executor.submit(generate_variants, digest, path)
+
+
+def find_image(digest, variant):
+    """(path, mimetype, final) for a requested image. `final` is False when
+    the variant isn't ready yet and the original is served in its place.
+    Raises FileNotFoundError for unknown images or variants."""
+    if not DIGEST_PATTERN.match(digest) or (variant != "original" and variant not in VARIANTS):
+        raise FileNotFoundError(digest)
+
+    if variant != "original":
+        path = variant_path(digest, variant)
+        if os.path.exists(path):
+            return path, "image/webp", True
+
+    path, mimetype = original_path(digest)
+    if not path:
+        raise FileNotFoundError(digest)
+    return path, mimetype, variant == "original"
+
+
+@click.command("images-backfill")
+def backfill_command():
+    """Move budget images stored as plain files into the content-addressed store."""
+    moved = skipped = 0
+    for budget in Budget.query.filter(Budget.image_url.isnot(None)):
+        if budget.image_url.startswith("/budgets/images/"):
+            continue
+        path = os.path.join(UPLOAD_FOLDER, os.path.basename(budget.image_url))
+        try:
+            with open(path, "rb") as stream:
+                digest, stored = store_image(stream, max_bytes=float("inf"))
+        except (OSError, ValueError) as e:
+            click.echo(f"Budget {budget.id}: skipped {budget.image_url} ({e})")
+            skipped += 1
+            continue
+        generate_variants(digest, stored)
+        budget.image_url = image_url(digest)
+        moved += 1
+    db.session.commit()
+    click.echo(f"Moved {moved} budget images, skipped {skipped}.")
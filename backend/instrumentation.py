@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+def redact(parameters):
+    """Bound parameters with every value replaced by its type name, so slow
+    query logs never carry amounts, emails or password hashes"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: one parameter set per row
+            return f"{len(parameters)} x {redact(parameters[0])}"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def one_line(statement, limit=500):
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+class QueryInstrumentation:
+    """Counts and times the SQL statements each request runs, from the
+    engine's before/after_cursor_execute events.
+
+    Every response gets a Server-Timing header, e.g.
+    `db;dur=4.2;desc="7 queries", app;dur=11.8`. Statements slower than
+    SLOW_QUERY_MS are logged with their parameters redacted. A request that
+    runs the same statement (same SQL text, different parameters) at least
+    N_PLUS_ONE_THRESHOLD times is logged as a likely N+1 loop and counted
+    per endpoint in stats().
+
+    QUERY_INSTRUMENTATION=False leaves the engine and responses untouched.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.slow_query_ms = 200.0
+        self.n_plus_one_threshold = 10
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "queries": 0, "slow_queries": 0, "n_plus_one": 0}
+        self.query_seconds = 0.0
+        self.max_queries = 0
+        self.n_plus_one_endpoints = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("QUERY_INSTRUMENTATION", True)
+        self.slow_query_ms = float(app.config.get("SLOW_QUERY_MS", 200))
+        self.n_plus_one_threshold = int(app.config.get("N_PLUS_ONE_THRESHOLD", 10))
+        app.extensions["query_instrumentation"] = self
+        if not self.enabled:
+            return
+
+        # Must run after db.init_app
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self.before_cursor_execute)
+            event.listen(db.engine, "after_cursor_execute", self.after_cursor_execute)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def before_cursor_execute(self, _conn, _cursor, _statement, _parameters, context, _executemany):
+        # Kept on the statement's execution context, not the pooled connection,
+        # so a statement that raises (no after_cursor_execute) leaves nothing behind
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    def after_cursor_execute(self, _conn, _cursor, statement, parameters, context, _executemany):
+        started = getattr(context, "_query_start", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+
+        if has_request_context() and "query_count" in g:
+            g.query_count += 1
+            g.query_seconds += elapsed
+            g.query_statements[statement] += 1
+
+        if elapsed * 1000 >= self.slow_query_ms:
+            with self.lock:
+                self.counters["slow_queries"] += 1
+            logger.warning("Slow query", extra={
+                "duration_ms": round(elapsed * 1000, 1),
+                "endpoint": request.endpoint if has_request_context() else None,
+                "statement": one_line(statement),
+                "params": redact(parameters)
+            })
+
+    def start_request(self):
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+        g.query_seconds = 0.0
+        g.query_statements = Counter()
+
+    def finish_request(self, response):
+        if "query_count" not in g:
+            return response
+        total = time.perf_counter() - g.request_started
+
+        repeated = [
+            (statement, count) for statement, count in g.query_statements.items()
+            if count >= self.n_plus_one_threshold
+        ]
+        for statement, count in repeated:
+            logger.warning("Possible N+1", extra={
+                "endpoint": request.endpoint,
+                "executions": count,
+                "statement": one_line(statement)
+            })
+
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["queries"] += g.query_count
+            self.query_seconds += g.query_seconds
+            self.max_queries = max(self.max_queries, g.query_count)
+            if repeated:
+                self.counters["n_plus_one"] += 1
+                self.n_plus_one_endpoints[request.endpoint] += 1
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={g.query_seconds * 1000:.2f};desc="{g.query_count} queries", app;dur={total * 1000:.2f}'
+        )
+        return response
+
+    def stats(self):
+        with self.lock:
+            requests = self.counters["requests"]
+            return dict(
+                self.counters,
+                enabled=self.enabled,
+                slow_query_ms=self.slow_query_ms,
+                n_plus_one_threshold=self.n_plus_one_threshold,
+                avg_queries=round(self.counters["queries"] / requests, 2) if requests else None,
+                max_queries=self.max_queries,
+                avg_query_ms=round(self.query_seconds / requests * 1000, 2) if requests else None,
+                n_plus_one_endpoints=dict(self.n_plus_one_endpoints.most_common())
+            )
+
+
+query_instrumentation = QueryInstrumentation()
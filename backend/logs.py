@@ -0,0 +1,213 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+logger = logging.getLogger(__name__)
+
+# Incoming X-Request-ID values are reused only if they look like an id
+REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# Everything a LogRecord carries by itself; any other attribute came from extra=
+RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message", "asctime", "taskName", "request_id", "method", "path"
+}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, the request
+    it belongs to, anything passed via extra= and the traceback if any"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry.update(request_id=record.request_id, method=record.method, path=record.path)
+        entry.update({key: value for key, value in record.__dict__.items() if key not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request's id, method and path. Runs in
+    the thread that logged, where the request context is still available."""
+
+    def filter(self, record):
+        if has_request_context() and "request_id" in g:
+            record.request_id = g.request_id
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Keeps `rate` of DEBUG records and everything above. The decision is
+    made per request id, so a sampled request keeps all of its debug
+    records and an unsampled one drops all of them."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.threshold = int(rate * 0xFFFFFFFF)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            return zlib.crc32(request_id.encode()) <= self.threshold
+        return zlib.crc32(os.urandom(4)) <= self.threshold
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that never waits: when the queue is full the record is
+    dropped and counted instead of stalling the request thread"""
+
+    def __init__(self, log_queue, pipeline):
+        super().__init__(log_queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record):
+        # Merge the arguments now (they may change once we return) but leave
+        # exc_info alone, so the traceback is formatted by the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        self.pipeline.ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.count("dropped")
+        else:
+            self.pipeline.count("queued")
+
+
+class LogPipeline:
+    """Structured JSON logging with the I/O on a background thread.
+
+    Every logger propagates to a root QueueHandler that only tags the record
+    with the request id, samples DEBUG records and puts it on a bounded
+    queue; a QueueListener thread formats the JSON lines and writes them to
+    stderr. A full queue drops records rather than blocking a request.
+
+    Each request gets an id, taken from a sane X-Request-ID header or
+    generated, which is echoed back in the X-Request-ID response header.
+
+    LOG_LEVEL sets the root level (INFO), LOG_DEBUG_SAMPLE_RATE the share
+    of requests whose DEBUG records are kept (0.1) and LOG_QUEUE_SIZE the
+    queue bound (10000).
+    """
+
+    def __init__(self, app=None):
+        self.level = logging.INFO
+        self.sample_rate = 0.1
+        self.queue = queue.Queue(10000)
+        self.handler = None
+        self.listener = None
+        self.listener_pid = None
+        self.stream = sys.stderr
+        self.lock = threading.Lock()
+        self.counters = {"queued": 0, "dropped": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.level = logging.getLevelName(str(app.config.get("LOG_LEVEL", "INFO")).upper())
+        self.sample_rate = float(app.config.get("LOG_DEBUG_SAMPLE_RATE", 0.1))
+        self.stream = app.config.get("LOG_STREAM", sys.stderr)
+        self.stop()
+        self.queue = queue.Queue(int(app.config.get("LOG_QUEUE_SIZE", 10000)))
+
+        root = logging.getLogger()
+        if self.handler is not None:
+            root.removeHandler(self.handler)
+        self.handler = NonBlockingQueueHandler(self.queue, self)
+        self.handler.addFilter(RequestContextFilter())
+        self.handler.addFilter(DebugSampler(self.sample_rate))
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        # app.logger would otherwise also write plain text to stderr itself
+        app.logger.removeHandler(default_handler)
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.extensions["log_pipeline"] = self
+
+    def ensure_listener(self):
+        # Threads don't survive a fork; each gunicorn worker starts its own
+        if self.listener_pid == os.getpid():
+            return
+        with self.lock:
+            if self.listener_pid != os.getpid():
+                output = logging.StreamHandler(self.stream)
+                output.setFormatter(JSONFormatter())
+                self.listener = QueueListener(self.queue, output)
+                self.listener.start()
+                self.listener_pid = os.getpid()
+
+    def stop(self):
+        """Flush queued records and stop the listener thread"""
+        with self.lock:
+            if self.listener is not None and self.listener_pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self.listener_pid = None
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def start_request(self):
+        request_id = request.headers.get("X-Request-ID", "")
+        g.request_id = request_id if REQUEST_ID.match(request_id) else uuid.uuid4().hex
+        g.log_started = time.perf_counter()
+
+    def finish_request(self, response):
+        if "request_id" not in g:
+            return response
+        response.headers["X-Request-ID"] = g.request_id
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request finished", extra={
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - g.log_started) * 1000, 2)
+            })
+        return response
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                self.counters,
+                level=logging.getLevelName(self.level),
+                debug_sample_rate=self.sample_rate,
+                queue_size=self.queue.qsize(),
+                queue_max=self.queue.maxsize
+            )
+
+
+log_pipeline = LogPipeline()
+atexit.register(log_pipeline.stop)
@@ -0,0 +1,127 @@
+import os
+import time
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from models import db
+
+# With PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py does it), prometheus_client
+# keeps every value in a per-process mmap file there and /metrics sums the
+# files of all workers, so a scrape sees the whole server whichever worker
+# answers it. Without it, values live in this process only.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+requests_handled = Counter(
+    "http_requests", "HTTP requests handled",
+    ["method", "endpoint", "status"]
+)
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time from routing to response, per endpoint",
+    ["method", "endpoint"]
+)
+requests_in_progress = Gauge(
+    "http_requests_in_progress", "Requests currently being handled",
+    multiprocess_mode="livesum"
+)
+request_db_duration = Histogram(
+    "http_request_db_duration_seconds", "Time spent in SQL statements per request",
+    ["endpoint"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+request_db_queries = Histogram(
+    "http_request_db_queries", "SQL statements run per request",
+    ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+pool_size = Gauge(
+    "db_pool_size", "Connections the pool keeps open, summed over live workers",
+    multiprocess_mode="livesum"
+)
+pool_max_overflow = Gauge(
+    "db_pool_max_overflow", "Extra connections the pool may open under load, summed over live workers",
+    multiprocess_mode="livesum"
+)
+pool_checked_out = Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool",
+    multiprocess_mode="livesum"
+)
+pool_checkouts = Counter("db_pool_checkouts", "Connection checkouts from the pool")
+pool_connects = Counter("db_pool_connects", "New database connections opened")
+cache_events = Counter(
+    "cache_events", "Cache lookups (hits, misses, ...) and maintenance events",
+    ["cache", "event"]
+)
+
+
+class Metrics:
+    """Request, database pool and cache metrics for Prometheus at /metrics.
+
+    Requests are labelled with their endpoint (blueprint.view, e.g.
+    budget_bp.get_budgets), never the raw path, so ids in URLs don't
+    multiply the series. Per-request SQL time and statement counts come
+    from query_instrumentation and are missing if it is disabled.
+
+    METRICS_ENABLED=False registers nothing.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("METRICS_ENABLED", True)
+        app.extensions["metrics"] = self
+        if not self.enabled:
+            return
+
+        # Must run after db.init_app
+        with app.app_context():
+            engine = db.engine
+            event.listen(engine, "connect", lambda *_args: pool_connects.inc())
+            event.listen(engine, "checkout", self.on_checkout)
+            event.listen(engine, "checkin", lambda *_args: pool_checked_out.dec())
+            if hasattr(engine.pool, "size"):
+                pool_size.set(engine.pool.size())
+                pool_max_overflow.set(app.config["SQLALCHEMY_ENGINE_OPTIONS"].get("max_overflow", 10))
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.end_request)
+        app.add_url_rule("/metrics", "metrics", self.export)
+
+    def on_checkout(self, *_args):
+        pool_checkouts.inc()
+        pool_checked_out.inc()
+
+    def start_request(self):
+        g.metrics_started = time.perf_counter()
+        requests_in_progress.inc()
+
+    def finish_request(self, response):
+        if "metrics_started" not in g:
+            return response
+        endpoint = request.endpoint or "<unmatched>"
+        request_duration.labels(request.method, endpoint).observe(time.perf_counter() - g.metrics_started)
+        requests_handled.labels(request.method, endpoint, str(response.status_code)).inc()
+        if "query_count" in g:
+            request_db_duration.labels(endpoint).observe(g.query_seconds)
+            request_db_queries.labels(endpoint).observe(g.query_count)
+        return response
+
+    def end_request(self, _error):
+        # Teardown also runs when a view raised, so the gauge can't leak
+        if "metrics_started" in g:
+            requests_in_progress.dec()
+
+    def export(self):
+        if MULTIPROCESS:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            output = generate_latest(registry)
+        else:
+            output = generate_latest()
+        return Response(output, content_type=CONTENT_TYPE_LATEST)
+
+
+metrics = Metrics()
@@ -0,0 +1,44 @@
+"""Add email_notifications queue
+
+Revision ID: 5e0c7a2b9d14
+Revises: c3d91e07b2a4
+Create Date: 2026-10-18 17:21:44.602117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0c7a2b9d14'
+down_revision = 'c3d91e07b2a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('email_notifications',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('recipient', sa.String(length=120), nullable=False),
+    sa.Column('subject', sa.String(length=200), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('claimed_by', sa.String(length=32), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('email_notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_email_notifications_status_next_attempt_at', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('email_notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_email_notifications_status_next_attempt_at')
+
+    op.drop_table('email_notifications')
@@ -0,0 +1,26 @@
+"""Add expense listing index
+
+Revision ID: 78d9485f3de6
+Revises: 8d6ce17e5cbe
+Create Date: 2026-10-18 11:24:50.771905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '78d9485f3de6'
+down_revision = '8d6ce17e5cbe'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.create_index('ix_expense_user_id_date_id', ['user_id', 'date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.drop_index('ix_expense_user_id_date_id')
@@ -0,0 +1,36 @@
+"""Add budget_totals running totals
+
+Revision ID: 8084e7b90064
+Revises: 2bf55485a357
+Create Date: 2026-10-18 09:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8084e7b90064'
+down_revision = '2bf55485a357'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('budget_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(length=100), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'category')
+    )
+
+    # Backfill from the existing expenses
+    op.execute(
+        'INSERT INTO budget_totals (user_id, category, total) '
+        'SELECT user_id, category, SUM(amount) FROM expense GROUP BY user_id, category'
+    )
+
+
+def downgrade():
+    op.drop_table('budget_totals')
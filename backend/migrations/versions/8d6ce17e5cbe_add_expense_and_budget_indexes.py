@@ -0,0 +1,49 @@
+"""Add expense and budget indexes
+
+Revision ID: 8d6ce17e5cbe
+Revises: 8084e7b90064
+Create Date: 2026-10-18 10:03:27.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d6ce17e5cbe'
+down_revision = '8084e7b90064'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Only the first budget per category was ever used, but the others are
+    # still user data: refuse to go on until they are merged or deleted by hand
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT user_id, category, id, "limit" FROM budget WHERE (user_id, category) IN '
+        '(SELECT user_id, category FROM budget GROUP BY user_id, category HAVING COUNT(*) > 1) '
+        'ORDER BY user_id, category, id'
+    )).all()
+    if duplicates:
+        clashes = {}
+        for user_id, category, budget_id, limit in duplicates:
+            clashes.setdefault((user_id, category), []).append(f"id {budget_id} (limit {limit})")
+        raise RuntimeError(
+            "Each category may only have one budget; merge or delete the duplicates first: "
+            + "; ".join(f"user {user_id} {category!r}: {', '.join(rows)}"
+                        for (user_id, category), rows in clashes.items())
+        )
+
+    with op.batch_alter_table('budget', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_budget_user_id_category', ['user_id', 'category'])
+
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.create_index('ix_expense_user_id_category_date', ['user_id', 'category', 'date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.drop_index('ix_expense_user_id_category_date')
+
+    with op.batch_alter_table('budget', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_budget_user_id_category', type_='unique')
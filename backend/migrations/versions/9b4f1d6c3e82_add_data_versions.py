@@ -0,0 +1,61 @@
+"""Add per-user data versions and deleted_rows tombstones
+
+Revision ID: 9b4f1d6c3e82
+Revises: 5e0c7a2b9d14
+Create Date: 2026-10-18 18:02:13.475901
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4f1d6c3e82'
+down_revision = '5e0c7a2b9d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('data_updated_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('budget', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_budget_user_id_version', ['user_id', 'version'], unique=False)
+
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_expense_user_id_version', ['user_id', 'version'], unique=False)
+
+    op.create_table('deleted_rows',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=20), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deleted_rows', schema=None) as batch_op:
+        batch_op.create_index('ix_deleted_rows_user_id_table_name_version', ['user_id', 'table_name', 'version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('deleted_rows', schema=None) as batch_op:
+        batch_op.drop_index('ix_deleted_rows_user_id_table_name_version')
+
+    op.drop_table('deleted_rows')
+
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.drop_index('ix_expense_user_id_version')
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('budget', schema=None) as batch_op:
+        batch_op.drop_index('ix_budget_user_id_version')
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('data_updated_at')
+        batch_op.drop_column('data_version')
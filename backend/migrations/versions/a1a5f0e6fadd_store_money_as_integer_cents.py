@@ -0,0 +1,45 @@
+"""Store money as integer cents
+
+Revision ID: a1a5f0e6fadd
+Revises: fa37eaace7cf
+Create Date: 2026-10-18 15:02:44.913207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1a5f0e6fadd'
+down_revision = 'fa37eaace7cf'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs holding money
+MONEY_COLUMNS = [
+    ('expense', 'amount'),
+    ('budget', 'limit'),
+    ('budget', 'saving'),
+    ('budget_totals', 'total'),
+]
+
+
+def upgrade():
+    for table, column in MONEY_COLUMNS:
+        op.execute(f'UPDATE {table} SET "{column}" = ROUND("{column}" * 100)')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column,
+                   existing_type=sa.Float(),
+                   type_=sa.BigInteger(),
+                   existing_nullable=False,
+                   postgresql_using=f'"{column}"::bigint')
+
+
+def downgrade():
+    for table, column in MONEY_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column,
+                   existing_type=sa.BigInteger(),
+                   type_=sa.Float(),
+                   existing_nullable=False)
+        op.execute(f'UPDATE {table} SET "{column}" = "{column}" / 100.0')
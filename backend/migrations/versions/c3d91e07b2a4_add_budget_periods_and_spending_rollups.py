@@ -0,0 +1,63 @@
+"""Add budget periods and spending_rollups
+
+Revision ID: c3d91e07b2a4
+Revises: a1a5f0e6fadd
+Create Date: 2026-10-18 16:05:27.914302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d91e07b2a4'
+down_revision = 'a1a5f0e6fadd'
+branch_labels = None
+depends_on = None
+
+PERIOD_START = {
+    'sqlite': {
+        'day': "date(date)",
+        'week': "date(date, 'weekday 0', '-6 days')",
+        'month': "strftime('%Y-%m-01', date)",
+    },
+    'postgresql': {
+        'day': "date_trunc('day', date)::date",
+        'week': "date_trunc('week', date)::date",
+        'month': "date_trunc('month', date)::date",
+    },
+}
+
+
+def upgrade():
+    with op.batch_alter_table('budget', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('period', sa.String(length=10), server_default='lifetime', nullable=False))
+        batch_op.add_column(sa.Column('period_days', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('period_anchor', sa.Date(), nullable=True))
+
+    op.create_table('spending_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(length=100), nullable=False),
+    sa.Column('granularity', sa.String(length=10), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('total', sa.BigInteger(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'category', 'granularity', 'period_start')
+    )
+
+    # Backfill from the existing expenses (amounts are already in cents)
+    for granularity, start in PERIOD_START[op.get_bind().dialect.name].items():
+        op.execute(
+            'INSERT INTO spending_rollups (user_id, category, granularity, period_start, total, count) '
+            f"SELECT user_id, category, '{granularity}', {start}, SUM(amount), COUNT(*) FROM expense "
+            f'WHERE date IS NOT NULL GROUP BY user_id, category, {start}'
+        )
+
+
+def downgrade():
+    op.drop_table('spending_rollups')
+    with op.batch_alter_table('budget', schema=None) as batch_op:
+        batch_op.drop_column('period_anchor')
+        batch_op.drop_column('period_days')
+        batch_op.drop_column('period')
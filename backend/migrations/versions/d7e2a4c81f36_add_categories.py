@@ -0,0 +1,184 @@
+"""Add categories; budgets, expenses and totals reference them by id
+
+Revision ID: d7e2a4c81f36
+Revises: 9b4f1d6c3e82
+Create Date: 2026-10-18 19:11:52.730144
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e2a4c81f36'
+down_revision = '9b4f1d6c3e82'
+branch_labels = None
+depends_on = None
+
+PERIOD_START = {
+    'sqlite': {
+        'day': "date(date)",
+        'week': "date(date, 'weekday 0', '-6 days')",
+        'month': "strftime('%Y-%m-01', date)",
+    },
+    'postgresql': {
+        'day': "date_trunc('day', date)::date",
+        'week': "date_trunc('week', date)::date",
+        'month': "date_trunc('month', date)::date",
+    },
+}
+
+categories = sa.table('categories',
+    sa.column('id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('name_key', sa.String),
+)
+
+
+def name_key(name):
+    # Same as Category.key in models.py
+    return " ".join(name.split()).casefold()
+
+
+def create_totals(key_column, key_type):
+    op.create_table('budget_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column(key_column, key_type, nullable=False),
+    sa.Column('total', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    *([sa.ForeignKeyConstraint(['category_id'], ['categories.id'], )] if key_column == 'category_id' else []),
+    sa.PrimaryKeyConstraint('user_id', key_column)
+    )
+    op.create_table('spending_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column(key_column, key_type, nullable=False),
+    sa.Column('granularity', sa.String(length=10), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('total', sa.BigInteger(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    *([sa.ForeignKeyConstraint(['category_id'], ['categories.id'], )] if key_column == 'category_id' else []),
+    sa.PrimaryKeyConstraint('user_id', key_column, 'granularity', 'period_start')
+    )
+
+    # The totals are derived data: recompute them from the expenses
+    op.execute(
+        f'INSERT INTO budget_totals (user_id, {key_column}, total) '
+        f'SELECT user_id, {key_column}, SUM(amount) FROM expense GROUP BY user_id, {key_column}'
+    )
+    for granularity, start in PERIOD_START[op.get_bind().dialect.name].items():
+        op.execute(
+            f'INSERT INTO spending_rollups (user_id, {key_column}, granularity, period_start, total, count) '
+            f"SELECT user_id, {key_column}, '{granularity}', {start}, SUM(amount), COUNT(*) FROM expense "
+            f'WHERE date IS NOT NULL GROUP BY user_id, {key_column}, {start}'
+        )
+
+
+def upgrade():
+    op.create_table('categories',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('name_key', sa.String(length=100), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'name_key', name='uq_categories_user_id_name_key')
+    )
+
+    # One category per user and case/space-insensitive name. Budget spellings
+    # win over expense spellings; two budgets that only differ in case would
+    # end up sharing a category, which the budget unique constraint forbids.
+    bind = op.get_bind()
+    names = bind.execute(sa.text(
+        'SELECT user_id, category, 0 AS source, MIN(id) AS first_id FROM budget GROUP BY user_id, category '
+        'UNION ALL '
+        'SELECT user_id, category, 1 AS source, MIN(id) AS first_id FROM expense GROUP BY user_id, category '
+        'ORDER BY source, first_id'
+    )).all()
+
+    chosen = {}
+    budget_names = {}
+    for user_id, name, source, _ in names:
+        key = (user_id, name_key(name))
+        chosen.setdefault(key, " ".join(name.split()))
+        if source == 0:
+            budget_names.setdefault(key, []).append(name)
+    clashes = {key: spellings for key, spellings in budget_names.items() if len(spellings) > 1}
+    if clashes:
+        raise RuntimeError(
+            "Budgets whose categories only differ in case or spacing must be merged or renamed first: "
+            + "; ".join(f"user {user_id}: {', '.join(map(repr, spellings))}"
+                        for (user_id, _), spellings in sorted(clashes.items()))
+        )
+
+    if chosen:
+        op.bulk_insert(categories, [
+            {'user_id': user_id, 'name': name, 'name_key': key}
+            for (user_id, key), name in chosen.items()
+        ])
+    ids = {
+        (user_id, key): category_id
+        for category_id, user_id, key in bind.execute(sa.text('SELECT id, user_id, name_key FROM categories'))
+    }
+
+    for table in ('expense', 'budget'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('category_id', sa.Integer(), nullable=True))
+        updates = [
+            {'category_id': ids[(user_id, name_key(name))], 'user_id': user_id, 'category': name}
+            for user_id, name, source, _ in names if source == (0 if table == 'budget' else 1)
+        ]
+        if updates:
+            bind.execute(sa.text(
+                f'UPDATE {table} SET category_id = :category_id WHERE user_id = :user_id AND category = :category'
+            ), updates)
+
+    op.drop_table('spending_rollups')
+    op.drop_table('budget_totals')
+
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.drop_index('ix_expense_user_id_category_date')
+        batch_op.alter_column('category_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_expense_category_id_categories', 'categories', ['category_id'], ['id'])
+        batch_op.drop_column('category')
+        batch_op.create_index('ix_expense_user_id_category_id_date', ['user_id', 'category_id', 'date'], unique=False)
+
+    with op.batch_alter_table('budget', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_budget_user_id_category', type_='unique')
+        batch_op.alter_column('category_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_budget_category_id_categories', 'categories', ['category_id'], ['id'])
+        batch_op.drop_column('category')
+        batch_op.create_unique_constraint('uq_budget_user_id_category_id', ['user_id', 'category_id'])
+
+    create_totals('category_id', sa.Integer())
+
+
+def downgrade():
+    op.drop_table('spending_rollups')
+    op.drop_table('budget_totals')
+
+    for table in ('expense', 'budget'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('category', sa.String(length=100), nullable=True))
+        op.execute(
+            f'UPDATE {table} SET category = '
+            f'(SELECT name FROM categories WHERE categories.id = {table}.category_id)'
+        )
+
+    with op.batch_alter_table('budget', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_budget_user_id_category_id', type_='unique')
+        batch_op.drop_constraint('fk_budget_category_id_categories', type_='foreignkey')
+        batch_op.drop_column('category_id')
+        batch_op.alter_column('category', existing_type=sa.String(length=100), nullable=False)
+        batch_op.create_unique_constraint('uq_budget_user_id_category', ['user_id', 'category'])
+
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.drop_index('ix_expense_user_id_category_id_date')
+        batch_op.drop_constraint('fk_expense_category_id_categories', type_='foreignkey')
+        batch_op.drop_column('category_id')
+        batch_op.alter_column('category', existing_type=sa.String(length=100), nullable=False)
+        batch_op.create_index('ix_expense_user_id_category_date', ['user_id', 'category', 'date'], unique=False)
+
+    create_totals('category', sa.String(length=100))
+    op.drop_table('categories')
@@ -1,6 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
-from datetime import datetime
+from sqlalchemy.orm import column_property
+from datetime import datetime, timedelta
+from money import Cents, ZERO
 
 
 metadata = MetaData()
@@ -14,58 +16,193 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password = db.Column(db.String(512), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
+    # Bumped once per transaction that writes any of the user's budgets or
+    # expenses; drives ETags and ?since= deltas (see versions.py)
+    data_version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    data_updated_at = db.Column(db.DateTime, nullable=True)
 
     # Relationships
     expenses = db.relationship("Expense", backref="user", lazy=True)
     
 
+class Category(db.Model):
+    """A user's spending category. Budgets and expenses point at it by id;
+    names are matched through name_key, so "Food" and " food" are the same
+    category and renaming one renames it everywhere."""
+    __tablename__ = "categories"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "name_key", name="uq_categories_user_id_name_key"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    name_key = db.Column(db.String(100), nullable=False)
+
+    @staticmethod
+    def key(name):
+        """Case- and whitespace-insensitive form of a category name"""
+        return " ".join(str(name).split()).casefold()
+
+    def __repr__(self):
+        return f"<Category {self.id}: {self.name}>"
+
+
+def category_name(category_id):
+    """Read-only `category` name attribute for models keyed by category_id"""
+    return column_property(
+        db.select(Category.name).where(Category.id == category_id).scalar_subquery()
+    )
+
+
 class Expense(db.Model):
+    __table_args__ = (
+        db.Index("ix_expense_user_id_category_id_date", "user_id", "category_id", "date"),
+        db.Index("ix_expense_user_id_date_id", "user_id", "date", "id"),
+        db.Index("ix_expense_user_id_version", "user_id", "version"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    category = db.Column(db.String(100), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False)
+    category = category_name(category_id)
+    amount = db.Column(Cents, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # User data_version of the last write to this row
+    version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
 
     def __repr__(self):
         return f"<Expense {self.id}: {self.category} - {self.amount}>"
 
-    
+
+
+class BudgetTotal(db.Model):
+    """Running total of a user's expenses per category, kept in step with every
+    expense write so budget reads don't have to SUM the expense table."""
+    __tablename__ = "budget_totals"
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), primary_key=True)
+    total = db.Column(Cents, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<BudgetTotal {self.user_id}: {self.category_id} - {self.total}>"
+
+
+class SpendingRollup(db.Model):
+    """Per-period spending totals for a user's category at day, week (starting
+    Monday) and month granularity, maintained alongside budget_totals."""
+    __tablename__ = "spending_rollups"
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), primary_key=True)
+    granularity = db.Column(db.String(10), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    total = db.Column(Cents, default=0, nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<SpendingRollup {self.user_id}: {self.category_id} {self.granularity} {self.period_start} - {self.total}>"
+
 
 class Budget(db.Model):
+    __table_args__ = (
+        # One budget per category; also serves (user_id, category) lookups
+        db.UniqueConstraint("user_id", "category_id", name="uq_budget_user_id_category_id"),
+        db.Index("ix_budget_user_id_version", "user_id", "version"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    category = db.Column(db.String(100), nullable=False)
-    limit = db.Column(db.Float, nullable=False)
-    saving = db.Column(db.Float, default=0.0, nullable=False)  
+    category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False)
+    category = category_name(category_id)
+    limit = db.Column(Cents, nullable=False)
+    saving = db.Column(Cents, default=0, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     image_url = db.Column(db.String(255), nullable=True)
+    # lifetime (all expenses ever), monthly, weekly, or custom: repeating
+    # windows of period_days starting at period_anchor
+    period = db.Column(db.String(10), default="lifetime", server_default="lifetime", nullable=False)
+    period_days = db.Column(db.Integer, nullable=True)
+    period_anchor = db.Column(db.Date, nullable=True)
+    # User data_version of the last write to this row or to its spending
+    version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+
+    PERIODS = ("lifetime", "monthly", "weekly", "custom")
+
+    def period_bounds(self, day):
+        """(start, end) of the budget period containing `day`, end exclusive;
+        (None, None) for lifetime budgets"""
+        if self.period == "monthly":
+            start = day.replace(day=1)
+            return start, (start + timedelta(days=32)).replace(day=1)
+        if self.period == "weekly":
+            start = day - timedelta(days=day.weekday())
+            return start, start + timedelta(days=7)
+        if self.period == "custom":
+            offset = (day - self.period_anchor).days // self.period_days * self.period_days
+            start = self.period_anchor + timedelta(days=offset)
+            return start, start + timedelta(days=self.period_days)
+        return None, None
 
-    def to_dict(self):
+    def to_dict(self, spent):
+        """`spent` is the spending in the current period, as paired with each
+        budget by aggregates.budgets_with_spent in one query"""
         return {
             "id": self.id,
             "category": self.category,
+            "category_id": self.category_id,
             "limit": self.limit,
             "saving": self.saving, 
-            "spent": self.spent,
+            "spent": spent,
+            "savings": max(ZERO, self.limit - spent),
             "image_url": self.image_url,
             "user_id": self.user_id,
+            "period": self.period,
         }
 
-    @property
-    def spent(self):
-        expenses_for_budget = Expense.query.filter_by(
-            user_id=self.user_id,
-            category=self.category
-        ).all()
-        return sum(expense.amount for expense in expenses_for_budget) if expenses_for_budget else 0.0
-
-    @property
-    def savings(self):  # ✅ Automatically computes savings
-        return self.limit - self.spent
-
 
 class TokenBlocklist(db.Model):
     __tablename__ = "token_blocklist"
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, unique=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Copied from the token's exp claim; rows past it can be pruned
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+
+class DeletedRow(db.Model):
+    """Tombstone for a deleted budget or expense, so ?since= deltas can tell
+    clients what to drop"""
+    __tablename__ = "deleted_rows"
+    __table_args__ = (
+        db.Index("ix_deleted_rows_user_id_table_name_version", "user_id", "table_name", "version"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    table_name = db.Column(db.String(20), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+
+
+class EmailNotification(db.Model):
+    """Outbox of emails waiting to be sent by the notification worker. Rows
+    are written in the same transaction as the change that triggered them."""
+    __tablename__ = "email_notifications"
+    __table_args__ = (
+        db.Index("ix_email_notifications_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # pending -> sending (claimed by a worker) -> sent, or failed once the
+    # retries run out
+    status = db.Column(db.String(10), default="pending", nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_by = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<EmailNotification {self.id} to {self.recipient}: {self.status}>"
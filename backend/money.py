@@ -0,0 +1,47 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.types import BigInteger, TypeDecorator
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def to_decimal(value):
+    """Exact 2-place Decimal for a money value from JSON, CSV, or Python code"""
+    try:
+        amount = Decimal(str(value).strip()).quantize(CENT, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Invalid money value: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid money value: {value!r}")
+    return amount
+
+
+class Cents(TypeDecorator):
+    """Money stored as an integer number of minor units (BIGINT cents).
+
+    Python code sees exact Decimals. The database only ever stores and SUMs
+    integers, so aggregates can't drift the way float columns do.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_decimal(value) * 100)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return (Decimal(value) / 100).quantize(CENT)
+
+
+class MoneyJSONProvider(DefaultJSONProvider):
+    """Serialize Decimal amounts as JSON numbers, as the API always has"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return DefaultJSONProvider.default(o)
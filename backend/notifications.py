@@ -0,0 +1,241 @@
+"""Budget threshold emails, queued in the email_notifications table and sent
+by a background worker so SMTP latency never reaches the request path.
+
+To try it against a local SMTP stand-in (aiosmtpd is in requirements-dev.txt):
+
+    python -m aiosmtpd -n -l localhost:8025
+    MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=false NOTIFICATION_WORKER=1 flask run
+
+or leave NOTIFICATION_WORKER unset and run `flask notifications worker` as a
+separate process. `python -m benchmarks.check_notifications` checks delivery,
+retries and attempt counting against an in-process aiosmtpd server.
+"""
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from flask_mail import Message
+from sqlalchemy import event
+import click
+from models import db, EmailNotification, User
+from aggregates import as_day
+
+logger = logging.getLogger(__name__)
+
+notifications_cli = AppGroup("notifications", help="Send queued notification emails.")
+
+# Percent of a budget's limit at which an alert goes out
+THRESHOLDS = (80, 100)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+# A claimed batch that isn't finished by then (worker died) is retried
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def queue_email(user, subject, body):
+    """Add an email to the outbox in the caller's transaction"""
+    notification = EmailNotification(user_id=user.id, recipient=user.email, subject=subject, body=body)
+    db.session.add(notification)
+    db.session.info["notifications_queued"] = True
+    return notification
+
+
+def queue_threshold_alerts(budget, day, before, after):
+    """Queue an alert when the spend in the budget period containing `day`
+    went from `before` to `after` across one of THRESHOLDS; only the highest
+    threshold crossed is reported. Returns the queued notification or None."""
+    crossed = [t for t in THRESHOLDS if before * 100 < budget.limit * t <= after * 100]
+    if not crossed or budget.limit <= 0:
+        return None
+
+    threshold = crossed[-1]
+    start, end = budget.period_bounds(as_day(day))
+    period = "so far" if start is None else \
+        f"for {start:%d %b} - {end - timedelta(days=1):%d %b %Y}"
+    status = "reached its limit" if threshold == 100 else f"reached {threshold}% of its limit"
+    body = (f"Your {budget.category} budget has {status}.\n\n"
+            f"Spent {period}: {after:.2f} of {budget.limit:.2f}\n"
+            f"Remaining: {max(budget.limit - after, 0):.2f}\n")
+    return queue_email(
+        db.session.get(User, budget.user_id),
+        f"You've used {threshold}% of your {budget.category} budget",
+        body
+    )
+
+
+def claim_batch(batch_size, now):
+    """Mark up to `batch_size` due emails as ours and return them. Expired
+    claims from a dead worker are picked up again; two workers can't claim
+    the same row because the UPDATE re-checks next_attempt_at.
+
+    The attempt is counted when it is claimed, not when it fails, so an
+    email whose sending crashes or hangs the worker still runs out of
+    attempts: once its lease expires after the last one, it is failed
+    instead of claimed again."""
+    due = db.and_(
+        EmailNotification.status.in_(("pending", "sending")),
+        EmailNotification.next_attempt_at <= now
+    )
+    EmailNotification.query.filter(due, EmailNotification.attempts >= MAX_ATTEMPTS).update({
+        "status": "failed",
+        "claimed_by": None,
+        "last_error": db.func.coalesce(EmailNotification.last_error, "Lease expired during the last attempt")
+    }, synchronize_session=False)
+
+    claimable = db.and_(due, EmailNotification.attempts < MAX_ATTEMPTS)
+    ids = [row_id for row_id, in db.session.query(EmailNotification.id).filter(claimable).order_by(
+        EmailNotification.next_attempt_at, EmailNotification.id
+    ).limit(batch_size)]
+    if not ids:
+        db.session.commit()
+        return []
+
+    token = uuid.uuid4().hex
+    EmailNotification.query.filter(EmailNotification.id.in_(ids), claimable).update({
+        "status": "sending",
+        "claimed_by": token,
+        "attempts": EmailNotification.attempts + 1,
+        "next_attempt_at": now + CLAIM_LEASE
+    }, synchronize_session=False)
+    db.session.commit()
+    return EmailNotification.query.filter_by(claimed_by=token, status="sending").all()
+
+
+def schedule_retry(notification, error, now):
+    """Put a failed send back in the queue with exponential backoff, or fail
+    it for good once claim_batch has counted MAX_ATTEMPTS attempts"""
+    notification.last_error = str(error)[:1000]
+    notification.claimed_by = None
+    if notification.attempts >= MAX_ATTEMPTS:
+        notification.status = "failed"
+        return
+    notification.status = "pending"
+    delay = min(RETRY_BASE_SECONDS * 2 ** (notification.attempts - 1), RETRY_MAX_SECONDS)
+    notification.next_attempt_at = now + timedelta(seconds=delay)
+
+
+def send_batch(batch_size=50):
+    """Send one batch of due emails over a single SMTP connection; returns
+    (sent, failed) counts"""
+    now = datetime.utcnow()
+    batch = claim_batch(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    sent = 0
+    try:
+        with current_app.extensions["mail"].connect() as connection:
+            for notification in batch:
+                try:
+                    connection.send(Message(
+                        subject=notification.subject,
+                        recipients=[notification.recipient],
+                        body=notification.body
+                    ))
+                except Exception as e:
+                    logger.warning("Sending notification %s failed: %s", notification.id, e)
+                    schedule_retry(notification, e, now)
+                else:
+                    notification.status = "sent"
+                    notification.sent_at = now
+                    notification.claimed_by = None
+                    sent += 1
+    except Exception as e:
+        # Couldn't connect (or the connection dropped): retry whatever is left
+        logger.warning("SMTP connection failed: %s", e)
+        for notification in batch:
+            if notification.status == "sending":
+                schedule_retry(notification, e, now)
+    db.session.commit()
+    return sent, len(batch) - sent
+
+
+def send_pending(batch_size=50):
+    """Send batches until nothing is due; returns (sent, failed) totals"""
+    sent = failed = 0
+    while True:
+        batch_sent, batch_failed = send_batch(batch_size)
+        sent += batch_sent
+        failed += batch_failed
+        if batch_sent + batch_failed < batch_size:
+            return sent, failed
+
+
+class NotificationWorker:
+    """Daemon thread that drains the email queue every NOTIFICATION_POLL_SECONDS,
+    and straight away whenever a transaction that queued an email commits.
+
+    Started by init_app when NOTIFICATION_WORKER is set. Under gunicorn each
+    worker process runs its own thread; claims keep them from double-sending.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.thread = None
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.poll_interval = 5.0
+        self.batch_size = 50
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.poll_interval = app.config.get("NOTIFICATION_POLL_SECONDS", 5.0)
+        self.batch_size = app.config.get("NOTIFICATION_BATCH_SIZE", 50)
+        app.extensions["notification_worker"] = self
+        if not event.contains(db.session, "after_commit", self.after_commit):
+            event.listen(db.session, "after_commit", self.after_commit)
+        if app.config.get("NOTIFICATION_WORKER"):
+            self.start()
+
+    def after_commit(self, session):
+        if session.info.pop("notifications_queued", False):
+            self.wake_event.set()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="notification-worker", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.wake_event.clear()
+            with self.app.app_context():
+                try:
+                    send_pending(self.batch_size)
+                except Exception:
+                    logger.exception("Notification worker failed to send a batch")
+                    db.session.rollback()
+            self.wake_event.wait(self.poll_interval)
+
+
+notification_worker = NotificationWorker()
+
+
+@notifications_cli.command("send")
+@click.option("--batch-size", default=50, show_default=True, help="Emails sent per SMTP connection.")
+def send_command(batch_size):
+    """Send every email that is due, then exit."""
+    sent, failed = send_pending(batch_size)
+    click.echo(f"Sent {sent} emails, {failed} failed and will be retried or given up.")
+
+
+@notifications_cli.command("worker")
+def worker_command():
+    """Keep sending queued emails in the foreground until interrupted."""
+    notification_worker.app = current_app._get_current_object()
+    click.echo("Notification worker running; press Ctrl+C to stop.")
+    notification_worker.run()
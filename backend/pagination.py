@@ -0,0 +1,84 @@
+import base64
+from datetime import datetime, timedelta
+from models import db, Expense
+from categories import category_id_select
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(expense):
+    """Opaque token pointing just past `expense` in (date, id) order; an
+    undated expense is encoded with an empty date"""
+    raw = f"{expense.date.isoformat() if expense.date else ''}|{expense.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date, expense_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date) if date else None, int(expense_id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def parse_day(value, name):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' date. Use YYYY-MM-DD")
+
+
+def filter_expenses(query, user_id, args):
+    """Apply the optional category / from / to filters shared by the listings.
+    The category name is resolved to the user's category id in a subquery."""
+    if args.get("category"):
+        query = query.filter(Expense.category_id == category_id_select(user_id, args["category"]))
+    if args.get("from"):
+        query = query.filter(Expense.date >= parse_day(args["from"], "from"))
+    if args.get("to"):
+        query = query.filter(Expense.date < parse_day(args["to"], "to") + timedelta(days=1))
+    return query
+
+
+def expense_page(user_id, args):
+    """Return (expenses, next_cursor) for one page of a user's expenses.
+
+    Expenses come newest first, ordered by (date, id), followed by any
+    expenses without a date, newest id first. The page continues after
+    `cursor` with a keyset condition rather than an OFFSET, so every page
+    costs the same however deep it is. Supported args: limit, cursor,
+    category, from and to (inclusive, YYYY-MM-DD). Raises ValueError on bad
+    input.
+    """
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    query = filter_expenses(Expense.query.filter(Expense.user_id == user_id), user_id, args)
+
+    date = expense_id = None
+    if args.get("cursor"):
+        date, expense_id = decode_cursor(args["cursor"])
+
+    # Databases disagree on where NULLs sort, so dated and undated expenses
+    # are read separately, each in index order. One extra row tells whether
+    # another page exists.
+    expenses = []
+    if expense_id is None or date is not None:
+        dated = query.filter(Expense.date.isnot(None))
+        if date is not None:
+            dated = dated.filter(db.tuple_(Expense.date, Expense.id) < (date, expense_id))
+        expenses = dated.order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    if len(expenses) <= limit:
+        undated = query.filter(Expense.date.is_(None))
+        if expense_id is not None and date is None:
+            undated = undated.filter(Expense.id < expense_id)
+        expenses += undated.order_by(Expense.id.desc()).limit(limit + 1 - len(expenses)).all()
+
+    next_cursor = encode_cursor(expenses[limit - 1]) if len(expenses) > limit else None
+    return expenses[:limit], next_cursor
@@ -0,0 +1,215 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when PASSWORD_HASH_MAX_PENDING hashes are already running or
+    queued and no slot frees up within PASSWORD_HASH_QUEUE_TIMEOUT"""
+
+
+def timed_hash(password, method):
+    started = time.perf_counter()
+    return generate_password_hash(password, method), time.perf_counter() - started
+
+
+def timed_check(password_hash, password):
+    started = time.perf_counter()
+    return check_password_hash(password_hash, password), time.perf_counter() - started
+
+
+def default_workers():
+    """Hashing processes per web worker: the machine's cores shared out over
+    the gunicorn workers (WEB_CONCURRENCY, which gunicorn.conf.py sets), so
+    the server as a whole runs about one hashing process per core"""
+    web_workers = max(int(os.getenv("WEB_CONCURRENCY") or 1), 1)
+    return max((os.cpu_count() or 1) // web_workers, 1)
+
+
+def hash_method(password_hash):
+    """"scrypt:32768:8:1" for a werkzeug hash string"""
+    return password_hash.split("$", 1)[0]
+
+
+class PasswordHasher:
+    """Runs werkzeug password hashing in a bounded process pool, so a burst
+    of logins doesn't hold the GIL (and every request thread) for the
+    duration of each scrypt/pbkdf2 call.
+
+    PASSWORD_HASH_WORKERS is the pool size per web worker process; it
+    defaults to the cores divided by the gunicorn workers (default_workers).
+    At most PASSWORD_HASH_MAX_PENDING hashes (2 per hashing process by
+    default) may be running or waiting per web worker; callers beyond that
+    wait up to PASSWORD_HASH_QUEUE_TIMEOUT seconds for a slot and then get
+    HasherBusy, which the views turn into a 503. Both limits are per
+    process, and their defaults are sized so that the sum over all web
+    workers matches the machine. PASSWORD_HASH_WORKERS=0 hashes inline on
+    the calling thread.
+
+    The pool uses the forkserver start method: forking the web worker
+    itself would copy the state of its other threads (notification sender,
+    log listener, image executor), including locks they hold.
+
+    PASSWORD_HASH_METHOD is any method werkzeug's generate_password_hash
+    accepts. Changing it is safe: stored hashes keep verifying, and
+    needs_rehash() tells login to upgrade them.
+    """
+
+    def __init__(self, app=None):
+        self.method = "scrypt"
+        self.configured_workers = None
+        self.configured_max_pending = None
+        self.workers = 1
+        self.max_pending = 2
+        self.queue_timeout = 5.0
+        self.pool = None
+        self.pool_pid = None
+        self.pool_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.sized_pid = None
+        self.current_method = None
+        self.lock = threading.Lock()
+        self.counters = {"hashes": 0, "checks": 0, "rehashes": 0, "rejected": 0}
+        self.in_flight = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.hash_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get("PASSWORD_HASH_METHOD", "scrypt")
+        workers = app.config.get("PASSWORD_HASH_WORKERS")
+        self.configured_workers = None if workers in (None, "") else int(workers)
+        self.configured_max_pending = app.config.get("PASSWORD_HASH_MAX_PENDING")
+        self.queue_timeout = app.config.get("PASSWORD_HASH_QUEUE_TIMEOUT", 5.0)
+        self.sized_pid = None
+        self.current_method = None
+        self.shutdown()
+        app.extensions["password_hasher"] = self
+
+    def size(self):
+        # Resolved in each process on first use: with --preload the app is
+        # created in the gunicorn master, before the worker count is known
+        if self.sized_pid == os.getpid():
+            return
+        with self.pool_lock:
+            if self.sized_pid != os.getpid():
+                self.workers = default_workers() if self.configured_workers is None else self.configured_workers
+                self.max_pending = self.configured_max_pending or 2 * max(self.workers, 1)
+                self.slots = threading.BoundedSemaphore(self.max_pending)
+                self.sized_pid = os.getpid()
+
+    def executor(self):
+        # Created on first use in each process: a pool inherited across
+        # gunicorn's fork would point at the parent's worker processes
+        with self.pool_lock:
+            if self.pool is None or self.pool_pid != os.getpid():
+                context = multiprocessing.get_context("forkserver")
+                # Hashing processes only need this module, not the app
+                context.set_forkserver_preload(["passwords"])
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self.pool_pid = os.getpid()
+            return self.pool
+
+    def shutdown(self):
+        with self.pool_lock:
+            if self.pool is not None and self.pool_pid == os.getpid():
+                self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def run(self, fn, *args):
+        """fn(*args) in the pool; fn returns (result, seconds spent hashing)"""
+        self.size()
+        waited_from = time.perf_counter()
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self.count("rejected")
+            raise HasherBusy()
+        try:
+            with self.lock:
+                self.in_flight += 1
+            if self.workers:
+                pool = self.executor()
+                try:
+                    result, hashing = pool.submit(fn, *args).result()
+                except BrokenProcessPool:
+                    # A hashing process died (OOM killer, say); start a fresh pool next time
+                    with self.pool_lock:
+                        if self.pool is pool:
+                            self.pool = None
+                    raise
+            else:
+                result, hashing = fn(*args)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+        # Whatever the round trip took beyond the hash itself was spent waiting
+        queued = max(time.perf_counter() - waited_from - hashing, 0.0)
+        with self.lock:
+            self.queue_seconds += queued
+            self.max_queue_seconds = max(self.max_queue_seconds, queued)
+            self.hash_seconds += hashing
+        return result
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def hash(self, password):
+        password_hash = self.run(timed_hash, password, self.method)
+        self.count("hashes")
+        return password_hash
+
+    def check(self, password_hash, password):
+        matches = self.run(timed_check, password_hash, password)
+        self.count("checks")
+        return matches
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with other parameters than the
+        configured PASSWORD_HASH_METHOD (e.g. "scrypt" -> "scrypt:32768:8:1");
+        may raise HasherBusy the first time"""
+        if self.current_method is None:
+            # Werkzeug fills in defaults for a bare method name; hash once (in
+            # the pool, like any other hash) to see them
+            self.current_method = hash_method(self.run(timed_hash, "", self.method))
+        return hash_method(password_hash) != self.current_method
+
+    def check_and_upgrade(self, user, password):
+        """Verify a user's password, replacing the stored hash if it uses
+        outdated parameters. The caller commits."""
+        if not self.check(user.password, password):
+            return False
+        try:
+            if self.needs_rehash(user.password):
+                user.password = self.hash(password)
+                self.count("rehashes")
+        except HasherBusy:
+            # The login itself succeeded; upgrade on a quieter login
+            pass
+        return True
+
+    def stats(self):
+        self.size()
+        with self.lock:
+            counters = dict(self.counters)
+            calls = counters["hashes"] + counters["checks"]
+            return dict(
+                counters,
+                method=self.method,
+                workers=self.workers,
+                max_pending=self.max_pending,
+                in_flight=self.in_flight,
+                avg_queue_ms=round(self.queue_seconds / calls * 1000, 2) if calls else None,
+                max_queue_ms=round(self.max_queue_seconds * 1000, 2),
+                avg_hash_ms=round(self.hash_seconds / calls * 1000, 2) if calls else None
+            )
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,137 @@
+import hashlib
+from datetime import datetime, time
+from flask import current_app, request
+from sqlalchemy import event
+from werkzeug.http import is_resource_modified
+from models import db, User, Budget, Expense, DeletedRow
+
+# Models whose writes bump the owner's data version -> tombstone table name
+VERSIONED_MODELS = {Budget: "budget", Expense: "expense"}
+
+
+def stamp(user_id, session=None):
+    """The user's data version for the current transaction, bumped on first
+    use. The UPDATE holds the user row until commit, so each user's writes
+    get increasing versions in commit order."""
+    session = session or db.session
+    user_id = int(user_id)
+    versions = session.info.setdefault("data_versions", {})
+    if user_id not in versions:
+        versions[user_id] = session.execute(
+            db.update(User)
+            .where(User.id == user_id)
+            .values(data_version=User.data_version + 1, data_updated_at=datetime.utcnow())
+            .returning(User.data_version)
+        ).scalar_one()
+    return versions[user_id]
+
+
+def stamp_users(user_ids=None):
+    """Bump the data version of the given users (all users by default) and
+    mark all of their budgets changed, for writes that bypass the ORM such
+    as a totals rebuild. ETags, ?since= deltas and the summary cache then
+    all see the change."""
+    users = db.update(User).values(data_version=User.data_version + 1, data_updated_at=datetime.utcnow())
+    budgets = db.update(Budget).values(
+        version=db.select(User.data_version).where(User.id == Budget.user_id).scalar_subquery()
+    )
+    if user_ids is not None:
+        user_ids = [int(user_id) for user_id in user_ids]
+        if not user_ids:
+            return
+        users = users.where(User.id.in_(user_ids))
+        budgets = budgets.where(Budget.user_id.in_(user_ids))
+    db.session.execute(users, execution_options={"synchronize_session": False})
+    db.session.execute(budgets, execution_options={"synchronize_session": False})
+    db.session.info.pop("data_versions", None)
+
+
+def touch_budget(user_id, category_id):
+    """Mark the user's budget for the category as changed, e.g. because the
+    spending behind it moved"""
+    db.session.execute(
+        db.update(Budget)
+        .where(Budget.user_id == int(user_id), Budget.category_id == category_id)
+        .values(version=stamp(user_id)),
+        execution_options={"synchronize_session": False}
+    )
+
+
+@event.listens_for(db.session, "before_flush")
+def stamp_versioned_rows(session, _flush_context, _instances):
+    """Stamp new and changed budgets/expenses with the data version, and
+    leave a tombstone for deleted ones"""
+    for obj in list(session.new) + list(session.dirty):
+        if type(obj) in VERSIONED_MODELS and obj.user_id is not None and session.is_modified(obj):
+            obj.version = stamp(obj.user_id, session)
+    for obj in list(session.deleted):
+        if type(obj) in VERSIONED_MODELS:
+            session.add(DeletedRow(
+                user_id=obj.user_id,
+                table_name=VERSIONED_MODELS[type(obj)],
+                row_id=obj.id,
+                version=stamp(obj.user_id, session)
+            ))
+
+
+@event.listens_for(db.session, "after_commit")
+@event.listens_for(db.session, "after_rollback")
+def forget_versions(session):
+    session.info.pop("data_versions", None)
+
+
+def parse_since(args):
+    """The ?since= data version as an int, or None; raises ValueError"""
+    if args.get("since") is None:
+        return None
+    try:
+        since = int(args["since"])
+    except ValueError:
+        raise ValueError("'since' must be a data version number")
+    if since < 0:
+        raise ValueError("'since' must be a data version number")
+    return since
+
+
+def deleted_since(table_name, user_id, since):
+    """Ids of the user's rows in `table_name` deleted after data version `since`"""
+    return [row_id for row_id, in db.session.query(DeletedRow.row_id).filter(
+        DeletedRow.user_id == int(user_id),
+        DeletedRow.table_name == table_name,
+        DeletedRow.version > since
+    ).order_by(DeletedRow.version, DeletedRow.row_id)]
+
+
+def conditional(user_id, build, *vary, not_before=None):
+    """Respond from the user's data version: 304 when the client's ETag (or
+    If-Modified-Since) is still current, without calling `build`; otherwise
+    `build(version)`'s response with a strong ETag and Last-Modified.
+
+    `vary` are the other inputs the response depends on, such as the query
+    string. `not_before` raises Last-Modified for responses that change
+    without a write (current-period totals at midnight).
+    """
+    version, updated_at = db.session.query(User.data_version, User.data_updated_at).filter(
+        User.id == int(user_id)
+    ).one()
+    key = ":".join(str(part) for part in (user_id, version, *vary))
+    etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+    last_modified = max(filter(None, [updated_at, not_before]), default=None)
+
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = build(version)
+    else:
+        response = current_app.response_class(status=304)
+
+    response.set_etag(etag)
+    response.headers["X-Data-Version"] = str(version)
+    if last_modified:
+        response.last_modified = last_modified
+    # Cacheable by the browser, but always revalidated
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def start_of_day(day):
+    return datetime.combine(day, time.min)
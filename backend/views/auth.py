@@ -1,14 +1,21 @@
-import traceback
+import logging
 from datetime import datetime
 from flask import Blueprint, request, jsonify
-from werkzeug.security import check_password_hash, generate_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from flask_mail import Message
 from models import User, db, TokenBlocklist
+from blocklist import blocklist_cache
+from passwords import HasherBusy, password_hasher
 from datetime import timedelta
 
+logger = logging.getLogger(__name__)
+
 auth_bp = Blueprint("auth_bp", __name__)
 
+@auth_bp.errorhandler(HasherBusy)
+def hasher_busy(_error):
+    return jsonify({"status": "error", "message": "Server is busy, please try again shortly"}), 503, {"Retry-After": "1"}
+
 @auth_bp.route("/user", methods=['POST'])
 def create_user():
     try:
@@ -28,7 +35,7 @@ def create_user():
         if len(password) < 8:
             return jsonify({"success": False, "error": "Password must be at least 8 characters long"}), 400
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = password_hasher.hash(password)
         new_user = User(username=username, email=email, password=hashed_password)
 
         db.session.add(new_user)
@@ -37,8 +44,8 @@ def create_user():
         # ✅ FIX JWT TOKEN GENERATION
         try:
             access_token = create_access_token(identity=new_user.id, expires_delta=timedelta(days=1))
-        except Exception as token_error:
-            print("❌ Error generating access token:", token_error)
+        except Exception:
+            logger.exception("Error generating access token", extra={"user_id": new_user.id})
             return jsonify({"success": False, "error": "Failed to generate access token"}), 500
 
         return jsonify({
@@ -54,15 +61,16 @@ def create_user():
             }
         }), 201
 
-    except Exception as e:
+    except HasherBusy:
+        raise
+    except Exception:
         db.session.rollback()
-        print(f"❌ Registration error: {traceback.format_exc()}")
+        logger.exception("Registration error")
         return jsonify({"success": False, "error": "Registration failed. Please try again."}), 500
 
 @auth_bp.route("/login", methods=["POST"])
 def login():
    data = request.get_json()
-   print("Received login request:", data) 
    if not data:
        return jsonify({"status": "error", "message": "Invalid input"}), 400
   
@@ -73,10 +81,15 @@ def login():
        return jsonify({"status": "error", "message": "Email and password are required"}), 400
   
    user = User.query.filter(User.email.ilike(email)).first()
-   if not user or not check_password_hash(user.password, password):
+   if not user or not password_hasher.check_and_upgrade(user, password):
+       # Never log the submitted email or password, only whose login failed
+       logger.info("Login failed", extra={"user_id": user.id if user else None})
        return jsonify({"status": "error", "message": "Invalid email or password"}), 401
+   # Commits the new hash if check_and_upgrade replaced an outdated one
+   db.session.commit()
   
    access_token = create_access_token(identity=str(user.id))  # Convert user.id to string
+   logger.debug("Login succeeded", extra={"user_id": user.id})
    return jsonify({
        "status": "success",
        "message": "Login successful",
@@ -175,14 +188,14 @@ def change_password():
     if not current_password or not new_password or not confirm_password:
         return jsonify({"status": "error", "message": "All fields are required"}), 400
 
-    if not check_password_hash(user.password, current_password):
+    if not password_hasher.check(user.password, current_password):
         return jsonify({"status": "error", "message": "Current password is incorrect"}), 400
 
     if new_password != confirm_password:
         return jsonify({"status": "error", "message": "Passwords do not match"}), 400
 
     # Hash and update the password
-    user.password = generate_password_hash(new_password)
+    user.password = password_hasher.hash(new_password)
     db.session.commit()
 
     return jsonify({"status": "success", "message": "Password updated successfully"}), 200
@@ -195,9 +208,11 @@ def logout():
     if not jti:
         return jsonify({"status": "error", "message": "Token invalid"}), 400
 
-    now = datetime.now(timezone.utc)
-    db.session.add(TokenBlocklist(jti=jti, created_at=now))
+    # Naive UTC, like every other DateTime column
+    expires_at = datetime.utcfromtimestamp(get_jwt()["exp"])
+    db.session.add(TokenBlocklist(jti=jti, created_at=datetime.utcnow(), expires_at=expires_at))
     db.session.commit()
+    blocklist_cache.revoke(jti)
 
     return jsonify({"status": "success", "message": "Logged out successfully"}), 200
 
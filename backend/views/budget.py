@@ -1,20 +1,30 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
 import os
 import logging
-import traceback
 from datetime import datetime
 from models import Budget, Expense, db
+from aggregates import apply_expense_delta, budget_period_history, budgets_with_spent, period_spent
+from forecast import forecast_budgets
+from notifications import queue_threshold_alerts
+from pagination import expense_page
+from money import to_decimal, ZERO
+from categories import resolve_category
+from cache import summary_cache
+from versions import conditional, deleted_since, parse_since, start_of_day
+from images import UPLOAD_FOLDER, VARIANTS, find_image, image_url, schedule_variants, store_image
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 budget_bp = Blueprint("budget_bp", __name__)
 
-UPLOAD_FOLDER = "uploads/budget_images"
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
 
+# Stored images are content-addressed, so their URLs never change meaning
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
@@ -23,130 +33,263 @@ def allowed_file(filename):
 
 def calculate_savings(limit, spent):
     """Calculate savings ensuring it's never negative"""
-    return max(0, float(limit) - float(spent))
+    return max(ZERO, limit - spent)
 
-def get_expenses_total(user_id, category):
-    """Helper to get total expenses for a category"""
-    return db.session.query(db.func.sum(Expense.amount)).filter_by(
-        user_id=user_id,
-        category=category
-    ).scalar() or 0.0
+def format_expense(expense):
+    return {
+        'id': expense.id,
+        'category': expense.category,
+        'category_id': expense.category_id,
+        'amount': expense.amount,
+        'date': expense.date.strftime('%Y-%m-%d') if expense.date else None
+    }
 
-def format_budget(budget, expenses_amount=0):
+def current_spent(budget):
+    """Helper to get spending in the budget's current period"""
+    return period_spent(budget, datetime.utcnow())
+
+def apply_period(budget, data):
+    """Set the budget period fields from request data; raises ValueError"""
+    period = data.get('period', budget.period or "lifetime")
+    if period not in Budget.PERIODS:
+        raise ValueError(f"Period must be one of: {', '.join(Budget.PERIODS)}")
+    budget.period = period
+
+    if period != "custom":
+        budget.period_days = budget.period_anchor = None
+        return
+
+    try:
+        budget.period_days = int(data.get('period_days', budget.period_days or 0))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid period_days value")
+    if budget.period_days <= 0:
+        raise ValueError("Custom periods need a positive period_days")
+    try:
+        anchor = data.get('period_anchor')
+        if anchor:
+            budget.period_anchor = datetime.strptime(anchor, '%Y-%m-%d').date()
+        elif not budget.period_anchor:
+            budget.period_anchor = datetime.utcnow().date()
+    except ValueError:
+        raise ValueError("Invalid period_anchor. Use YYYY-MM-DD")
+
+def format_budget(budget, expenses_amount=ZERO):
     return {
         "id": budget.id,
         "category": budget.category,
+        "category_id": budget.category_id,
         "saving": calculate_savings(budget.limit, expenses_amount),
-        "limit": float(budget.limit) if budget.limit is not None else 0.0,
-        "spent": float(expenses_amount),
+        "limit": budget.limit if budget.limit is not None else ZERO,
+        "spent": expenses_amount,
         "user_id": budget.user_id,
-        "image_url": budget.image_url
+        "image_url": budget.image_url,
+        "period": budget.period or "lifetime"
     }
 
 @budget_bp.route('/budgets', methods=['POST'])
 @jwt_required()
 def create_budget():
     data = request.get_json()
-    logger.debug(f"Received data: {data}")
+    logger.debug("Create budget request", extra={"fields": sorted(data) if isinstance(data, dict) else None})
 
-    if not data or 'category' not in data or 'limit' not in data:
+    if not data or ('category' not in data and 'category_id' not in data) or 'limit' not in data:
         return jsonify({"error": "Category and limit are required"}), 400
 
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
 
     try:
-        limit = float(data['limit'])
+        limit = to_decimal(data['limit'])
         if limit <= 0:
             return jsonify({"error": "Limit must be positive"}), 400
     except ValueError:
         return jsonify({"error": "Invalid limit value"}), 400
 
     try:
-        new_budget = Budget(
-            category=data['category'],
-            limit=limit,
-            user_id=user_id,
-            image_url=data.get('image_url')
-        )
+        category = resolve_category(user_id, data, create=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    new_budget = Budget(
+        category_id=category.id,
+        limit=limit,
+        user_id=user_id,
+        image_url=data.get('image_url')
+    )
+    try:
+        apply_period(new_budget, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
         db.session.add(new_budget)
         db.session.commit()
+        summary_cache.invalidate(user_id)
         return jsonify({
             "message": "Budget created successfully",
             "budget": format_budget(new_budget)
         }), 201
-    except Exception as e:
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": f"A budget for '{category.name}' already exists"}), 409
+    except Exception:
         db.session.rollback()
-        logger.error(f"Error creating budget: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error creating budget")
         return jsonify({"error": "An error occurred while creating the budget"}), 500
 
 @budget_bp.route("/budgets", methods=["GET"])
 @jwt_required()
 def get_budgets():
     try:
-        user_id = get_jwt_identity()
-        budgets = Budget.query.filter_by(user_id=user_id).all()
-        return jsonify([format_budget(b, get_expenses_total(user_id, b.category)) for b in budgets]), 200
-    except Exception as e:
-        logger.error(f"Error fetching budgets: {e}")
+        user_id = int(get_jwt_identity())
+        try:
+            since = parse_since(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        today = datetime.utcnow().date()
+
+        def build(version):
+            if since is None:
+                return jsonify(summary_cache.get_or_build(user_id, f"budgets:{today}", version, lambda: [
+                    format_budget(b, spent) for b, spent in budgets_with_spent(user_id, today)
+                ]))
+            budgets = [format_budget(b, spent) for b, spent in budgets_with_spent(user_id, today, since)]
+            return jsonify({"version": version, "changed": budgets, "deleted": deleted_since("budget", user_id, since)})
+
+        # Current-period totals roll over at midnight, so today is part of the ETag
+        return conditional(user_id, build, today, request.query_string, not_before=start_of_day(today))
+    except Exception:
+        logger.exception("Error fetching budgets")
         return jsonify({"error": "An error occurred while fetching budgets"}), 500
 
+@budget_bp.route("/budgets/forecast", methods=["GET"])
+@jwt_required()
+def get_budget_forecasts():
+    """Burn rate and projected period-end spend for all of the user's budgets"""
+    user_id = int(get_jwt_identity())
+    return jsonify(forecast_budgets(user_id)), 200
+
 @budget_bp.route("/budgets/<int:budget_id>", methods=["GET"])
 @jwt_required()
 def get_budget(budget_id):
     try:
-        user_id = get_jwt_identity()
+        user_id = int(get_jwt_identity())
         budget = Budget.query.get_or_404(budget_id)
         if budget.user_id != user_id:
             return jsonify({"error": "Unauthorized"}), 403
-        total_expenses = get_expenses_total(user_id, budget.category)
-        return jsonify(format_budget(budget, total_expenses)), 200
-    except Exception as e:
-        logger.error(f"Error fetching budget: {e}")
+        today = datetime.utcnow().date()
+
+        def build(version):
+            return jsonify(summary_cache.get_or_build(
+                user_id, f"budget:{budget_id}:{today}", version,
+                lambda: format_budget(budget, current_spent(budget))
+            ))
+
+        return conditional(user_id, build, budget_id, today, not_before=start_of_day(today))
+    except Exception:
+        logger.exception("Error fetching budget")
         return jsonify({"error": "An error occurred while fetching budget"}), 500
 
+@budget_bp.route("/budgets/<int:budget_id>/history", methods=["GET"])
+@jwt_required()
+def get_budget_history(budget_id):
+    user_id = int(get_jwt_identity())
+    budget = Budget.query.get_or_404(budget_id)
+    if budget.user_id != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        periods = int(request.args.get('periods', 12))
+        if not 1 <= periods <= 120:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "periods must be between 1 and 120"}), 400
+
+    return jsonify({
+        "id": budget.id,
+        "category": budget.category,
+        "period": budget.period,
+        "limit": budget.limit,
+        "history": [{
+            "period_start": start.strftime('%Y-%m-%d'),
+            "spent": total,
+            "count": count,
+            "saving": calculate_savings(budget.limit, total)
+        } for start, total, count in budget_period_history(budget, periods)]
+    }), 200
+
 @budget_bp.route("/budgets/<int:budget_id>", methods=["PUT"])
 @jwt_required()
 def update_budget(budget_id):
     try:
-        user_id = get_jwt_identity()
+        user_id = int(get_jwt_identity())
         budget = Budget.query.get_or_404(budget_id)
         if budget.user_id != user_id:
             return jsonify({"error": "Unauthorized"}), 403
         
         data = request.get_json()
-        if 'category' in data:
-            budget.category = data['category']
+        try:
+            apply_period(budget, data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if 'category' in data or 'category_id' in data:
+            try:
+                budget.category_id = resolve_category(user_id, data, create=True).id
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
         if 'limit' in data:
             try:
-                budget.limit = float(data['limit'])
+                budget.limit = to_decimal(data['limit'])
                 if budget.limit < 0:
                     return jsonify({"error": "Limit must be positive"}), 400
             except ValueError:
                 return jsonify({"error": "Invalid limit value"}), 400
         
         db.session.commit()
-        total_expenses = get_expenses_total(user_id, budget.category)
-        return jsonify(format_budget(budget, total_expenses)), 200
-    except Exception as e:
+        summary_cache.invalidate(user_id)
+        return jsonify(format_budget(budget, current_spent(budget))), 200
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "A budget for that category already exists"}), 409
+    except Exception:
         db.session.rollback()
-        logger.error(f"Error updating budget: {e}")
+        logger.exception("Error updating budget")
         return jsonify({"error": "An error occurred while updating budget"}), 500
 
 @budget_bp.route("/expenses", methods=["GET"])
 @jwt_required()
 def get_expenses():
     try:
-        user_id = get_jwt_identity()
-        expenses = Expense.query.filter_by(user_id=user_id).all()
-        return jsonify([{
-            'id': e.id,
-            'category': e.category,
-            'amount': float(e.amount),
-            'date': e.date.strftime('%Y-%m-%d') if e.date else None
-        } for e in expenses]), 200
-    except Exception as e:
-        logger.error(f"Error fetching expenses: {e}")
+        user_id = int(get_jwt_identity())
+        try:
+            since = parse_since(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Delta mode: clients drop the deleted ids first, then apply the changed rows
+        def build(version):
+            if since is not None:
+                changed = Expense.query.filter(
+                    Expense.user_id == user_id, Expense.version > since
+                ).order_by(Expense.version, Expense.id).all()
+                return jsonify({
+                    "version": version,
+                    "changed": [format_expense(e) for e in changed],
+                    "deleted": deleted_since("expense", user_id, since)
+                })
+
+            expenses, next_cursor = expense_page(user_id, request.args)
+            response = jsonify([format_expense(e) for e in expenses])
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return response
+
+        try:
+            return conditional(user_id, build, request.query_string)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    except Exception:
+        logger.exception("Error fetching expenses")
         return jsonify({"error": "An error occurred while fetching expenses"}), 500
 
 @budget_bp.route("/budgets/<int:budget_id>", methods=["DELETE"])
@@ -161,11 +304,12 @@ def delete_budget(budget_id):
         
         db.session.delete(budget)
         db.session.commit()
+        summary_cache.invalidate(user_id)
         return jsonify({"message": "Budget deleted successfully"}), 200
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        logger.error(f"Error deleting budget: {e}")
+        logger.exception("Error deleting budget")
         return jsonify({"error": "An error occurred while deleting budget"}), 500
 
 @budget_bp.route("/expenses", methods=["POST"])
@@ -176,39 +320,101 @@ def create_expense():
         user_id = int(get_jwt_identity())
 
         # Validate required fields
-        if not data or 'category' not in data or 'amount' not in data:
+        if not data or ('category' not in data and 'category_id' not in data) or 'amount' not in data:
             return jsonify({"error": "Missing required fields (category, amount)"}), 400
 
         # Validate amount
         try:
-            amount = float(data['amount'])
+            amount = to_decimal(data['amount'])
             if amount <= 0:
                 return jsonify({"error": "Amount must be positive"}), 400
         except ValueError:
             return jsonify({"error": "Invalid amount value"}), 400
 
+        try:
+            category = resolve_category(user_id, data, create=True)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         # Create new expense
         new_expense = Expense(
-            category=data['category'],
+            category_id=category.id,
             amount=amount,
             user_id=user_id,
             date=datetime.strptime(data['date'], '%Y-%m-%d') if 'date' in data else datetime.utcnow()
         )
 
         db.session.add(new_expense)
+        apply_expense_delta(user_id, category.id, new_expense.date, amount)
+        budget = Budget.query.filter_by(user_id=user_id, category_id=category.id).first()
+        if budget:
+            spent = period_spent(budget, new_expense.date)
+            queue_threshold_alerts(budget, new_expense.date, spent - amount, spent)
         db.session.commit()
+        summary_cache.invalidate(user_id)
 
         return jsonify({
             "message": "Expense created successfully",
             "expense": {
                 "id": new_expense.id,
-                "category": new_expense.category,
-                "amount": float(new_expense.amount),
+                "category": category.name,
+                "category_id": category.id,
+                "amount": new_expense.amount,
                 "date": new_expense.date.strftime('%Y-%m-%d')
             }
         }), 201
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        logger.error(f"Error creating expense: {e}")
-        return jsonify({"error": "An error occurred while creating expense"}), 500
\ No newline at end of file
+        logger.exception("Error creating expense")
+        return jsonify({"error": "An error occurred while creating expense"}), 500
+
+@budget_bp.route("/budgets/upload/<int:budget_id>", methods=["POST"])
+@jwt_required()
+def upload_budget_image(budget_id):
+    user_id = int(get_jwt_identity())
+    budget = Budget.query.get_or_404(budget_id)
+    if budget.user_id != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    upload = request.files.get('image')
+    if not upload or not upload.filename:
+        return jsonify({"error": "No image file provided"}), 400
+    if not allowed_file(secure_filename(upload.filename)):
+        return jsonify({"error": "Only PNG and JPEG images are supported"}), 400
+
+    try:
+        digest, path = store_image(upload.stream)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    schedule_variants(digest, path)
+
+    budget.image_url = image_url(digest)
+    db.session.commit()
+    summary_cache.invalidate(user_id)
+    return jsonify({
+        "message": "Image uploaded successfully",
+        "image_url": budget.image_url,
+        "variants": {variant: image_url(digest, variant) for variant in [*VARIANTS, "original"]}
+    }), 200
+
+@budget_bp.route("/budgets/images/<digest>/<variant>", methods=["GET"])
+def get_budget_image(digest, variant):
+    """Serve a stored image; public so <img> tags can load it without a token"""
+    try:
+        path, mimetype, final = find_image(digest, variant)
+    except FileNotFoundError:
+        return jsonify({"error": "Image not found"}), 404
+
+    # Until its variant is generated the original stands in, briefly cached
+    response = send_file(
+        os.path.abspath(path),
+        mimetype=mimetype,
+        etag=f"{digest}-{variant}" if final else f"{digest}-original",
+        max_age=IMAGE_MAX_AGE if final else 60,
+        conditional=True
+    )
+    response.cache_control.public = True
+    if final:
+        response.cache_control.immutable = True
+    return response
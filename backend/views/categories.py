@@ -0,0 +1,13 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import Category
+
+categories_bp = Blueprint("categories_bp", __name__)
+
+@categories_bp.route("/categories", methods=["GET"])
+@jwt_required()
+def get_categories():
+    """The user's categories, so clients can send category_id instead of names"""
+    user_id = int(get_jwt_identity())
+    categories = Category.query.filter_by(user_id=user_id).order_by(Category.name).all()
+    return jsonify([{"id": c.id, "name": c.name} for c in categories]), 200
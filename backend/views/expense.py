@@ -1,60 +1,134 @@
-from flask import Blueprint, jsonify, request
+import csv
+import io
+import json
+import logging
+import time
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Expense
-from datetime import datetime
-
+from models import db, Expense, Budget, Category
+from aggregates import ROLLUP_GRANULARITIES, apply_expense_delta, period_spent, reserve_budget, rollup_history, rollup_start
+from pagination import expense_page, filter_expenses, parse_day
+from money import to_decimal, ZERO
+from notifications import queue_threshold_alerts
+from versions import stamp
+from categories import category_id_select, resolve_categories, resolve_category
+from cache import summary_cache
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
 
 expense_bp = Blueprint("expense_bp", __name__)
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = ["id", "amount", "category", "date"]
+MAX_BULK_ROWS = 10000
+
+def get_budget_info(user_id, category):
+    """Get budget and spending in its current period from the running totals.
+    `category` is a category id, or a name for callers that still use names."""
+    if not isinstance(category, int):
+        category = category_id_select(user_id, category)
+    budget = Budget.query.filter_by(user_id=user_id, category_id=category).first()
+    if not budget:
+        return None, None, None
+
+    total_spent = period_spent(budget, datetime.utcnow())
+
+    savings = max(ZERO, budget.limit - total_spent)
+    return budget, total_spent, savings
 
 @expense_bp.route("/expense", methods=["POST"])
 @jwt_required()
 def create_expense():
+    user_id = int(get_jwt_identity())
     data = request.get_json()
-    if not all(k in data for k in ["amount", "category", "date"]):
-        return jsonify({"error": "Fields 'amount', 'category', and 'date' are required."}), 400
 
-    user_id = get_jwt_identity()
+    # Validate required fields; the category may be given by id or by name
+    required_fields = ["amount", "category", "date"]
+    if not all(field in data or (field == "category" and "category_id" in data) for field in required_fields):
+        return jsonify({"error": f"Missing required fields: {', '.join(required_fields)}"}), 400
+
+    # Validate amount
+    try:
+        amount = to_decimal(data["amount"])
+        if amount <= 0:
+            return jsonify({"error": "Amount must be positive"}), 400
+    except ValueError:
+        return jsonify({"error": "Invalid amount"}), 400
 
+    # Validate date
     try:
-        parsed_date = datetime.strptime(data["date"], "%Y-%m-%d").date()
+        date = datetime.strptime(data["date"], "%Y-%m-%d").date()
     except ValueError:
-        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD."}), 400
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
 
-    expense = Expense(
-        amount=data["amount"],
-        category=data["category"],
-        date=parsed_date,
-        user_id=user_id
-    )
+    # Check budget exists
+    try:
+        category = resolve_category(user_id, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    budget = category and Budget.query.filter_by(user_id=user_id, category_id=category.id).first()
+    if not budget:
+        return jsonify({"error": f"No budget found for category '{data.get('category', data.get('category_id'))}'"}), 400
 
-    try:  # Add a try-except block for database errors
+    try:
+        # Check the limit and reserve the amount in one atomic step, so
+        # concurrent requests can't overspend the budget between them
+        if not reserve_budget(budget, date, amount):
+            db.session.rollback()
+            remaining = budget.limit - period_spent(budget, date)
+            return jsonify({
+                "error": f"This expense exceeds your budget. You can only spend {remaining:.2f} more in this category."
+            }), 400
+
+        # Create expense
+        expense = Expense(
+            amount=amount,
+            category_id=budget.category_id,
+            date=date,
+            user_id=user_id
+        )
         db.session.add(expense)
+        updated_total_spent = period_spent(budget, date)
+        queue_threshold_alerts(budget, date, updated_total_spent - amount, updated_total_spent)
         db.session.commit()
+        summary_cache.invalidate(user_id)
+
+        updated_savings = max(ZERO, budget.limit - updated_total_spent)
 
         return jsonify({
-            "message": "Expense logged successfully!",
+            "message": "Expense created successfully",
             "expense": {
                 "id": expense.id,
                 "amount": expense.amount,
-                "category": expense.category,
+                "category": category.name,
+                "category_id": category.id,
                 "date": expense.date.strftime("%Y-%m-%d")
+            },
+            "budget_status": {
+                "category": budget.category,
+                "limit": budget.limit,
+                "total_spent": updated_total_spent,
+                "savings": updated_savings
             }
         }), 201
-    except Exception as e:  # Handle potential database errors
-        db.session.rollback()  # Rollback the transaction in case of error
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
 
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
 
 @expense_bp.route("/expense", methods=["GET"])
 @jwt_required()
 def get_expenses():
     try:
         user_id = get_jwt_identity()
-        expenses = Expense.query.filter_by(user_id=user_id).all()
+        try:
+            expenses, next_cursor = expense_page(user_id, request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
 
         if not expenses:
-            return jsonify({"success": True, "message": "No expenses found", "data": []}), 200
+            return jsonify({"success": True, "message": "No expenses found", "data": [], "next_cursor": None}), 200
 
         expense_list = [
             {
@@ -66,19 +140,320 @@ def get_expenses():
             for expense in expenses
         ]
 
-        return jsonify({"success": True, "data": expense_list}), 200 
+        return jsonify({"success": True, "data": expense_list, "next_cursor": next_cursor}), 200
 
-    except Exception as e:
-        print(f"Error fetching expenses: {e}")  # Log error for debugging
+    except Exception:
+        logger.exception("Error fetching expenses")
         return jsonify({"success": False, "error": "Failed to fetch expenses"}), 500
 
+def parse_expense_row(row):
+    """Validate one bulk row; returns (amount, category, date) or raises
+    ValueError. `category` is the row's category_id as an int if it has one,
+    otherwise its category name."""
+    if not isinstance(row, dict) or not all(row.get(k) for k in ["amount", "date"]) \
+            or not (row.get("category") or row.get("category_id")):
+        raise ValueError("Missing required fields: amount, category, date")
+    if row.get("category_id"):
+        try:
+            category = int(row["category_id"])
+        except (TypeError, ValueError):
+            raise ValueError("category_id must be an integer")
+    else:
+        category = str(row["category"])
+    try:
+        amount = to_decimal(row["amount"])
+    except (TypeError, ValueError):
+        raise ValueError("Invalid amount")
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    try:
+        date = datetime.strptime(str(row["date"]), "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+    return amount, category, date
+
+def read_bulk_rows():
+    """Rows from a JSON array ({"expenses": [...]} also accepted) or a CSV upload"""
+    if "file" in request.files:
+        stream = io.TextIOWrapper(request.files["file"].stream, encoding="utf-8")
+        return list(csv.DictReader(stream))
+    if request.mimetype == "text/csv":
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("expenses")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of expenses or a CSV file")
+    return data
+
+@expense_bp.route("/expenses/bulk", methods=["POST"])
+@jwt_required()
+def create_expenses_bulk():
+    started = time.perf_counter()
+    user_id = int(get_jwt_identity())
+
+    try:
+        rows = read_bulk_rows()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": str(e)}), 400
+    if len(rows) > MAX_BULK_ROWS:
+        return jsonify({"error": f"At most {MAX_BULK_ROWS} expenses per request"}), 400
+
+    errors = []
+    parsed = []
+    for index, row in enumerate(rows):
+        try:
+            parsed.append((index, *parse_expense_row(row)))
+        except ValueError as e:
+            errors.append({"row": index, "error": str(e)})
+
+    # Rows name their category by id or by name; either way they are
+    # grouped by category id from here on
+    categories = resolve_categories(user_id, {category for _, _, category, _ in parsed})
+    valid = []
+    for index, amount, category, date in parsed:
+        if category in categories:
+            valid.append((index, amount, categories[category].id, date))
+        else:
+            errors.append({"row": index, "error": f"No budget found for category '{category}'"})
+
+    # Budget limits are checked once per category against the batch total,
+    # and the running totals are written once per (category, day)
+    batch_totals = {}
+    day_totals = {}
+    for _, amount, category_id, date in valid:
+        batch_totals[category_id] = batch_totals.get(category_id, ZERO) + amount
+        total, count = day_totals.setdefault(category_id, {}).get(date.date(), (ZERO, 0))
+        day_totals[category_id][date.date()] = (total + amount, count + 1)
+
+    budgets = {
+        b.category_id: b for b in Budget.query.filter(
+            Budget.user_id == user_id, Budget.category_id.in_(batch_totals)
+        )
+    }
+
+    try:
+        # Reserve each category's rows atomically, then check every budget
+        # period the batch touched; an over-limit category is backed out
+        # again with the opposite deltas and all of its rows are rejected
+        rejected = {}
+        for category_id, batch_total in batch_totals.items():
+            budget = budgets.get(category_id)
+            if not budget:
+                name = next(c.name for c in categories.values() if c.id == category_id)
+                rejected[category_id] = f"No budget found for category '{name}'"
+                continue
+
+            days = day_totals[category_id]
+            for day, (total, count) in days.items():
+                apply_expense_delta(user_id, category_id, day, total, count)
+
+            # The batch's amount in each budget period it touches
+            periods = {}
+            for day, (total, _) in days.items():
+                start = budget.period_bounds(day)[0]
+                periods[start] = (day, periods.get(start, (day, ZERO))[1] + total)
+            spent = {start: period_spent(budget, day) for start, (day, _) in periods.items()}
+
+            over = [start for start, total in spent.items() if total > budget.limit]
+            if over:
+                for day, (total, count) in days.items():
+                    apply_expense_delta(user_id, category_id, day, -total, -count)
+                remaining = budget.limit - (spent[over[0]] - periods[over[0]][1])
+                rejected[category_id] = (f"Batch total {batch_total:.2f} exceeds your budget. "
+                                      f"You can only spend {remaining:.2f} more in this category.")
+                continue
+
+            for start, (day, total) in periods.items():
+                queue_threshold_alerts(budget, day, spent[start] - total, spent[start])
+
+        inserts = []
+        for index, amount, category_id, date in valid:
+            if category_id in rejected:
+                errors.append({"row": index, "error": rejected[category_id]})
+            else:
+                inserts.append({"amount": amount, "category_id": category_id, "date": date, "user_id": user_id,
+                                "version": stamp(user_id)})
+
+        if not inserts:
+            db.session.rollback()
+            return jsonify({"inserted": 0, "errors": sorted(errors, key=lambda e: e["row"])}), 400
+
+        db.session.execute(db.insert(Expense), inserts)
+        db.session.commit()
+        summary_cache.invalidate(user_id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    elapsed = time.perf_counter() - started
+    return jsonify({
+        "message": f"{len(inserts)} expenses created",
+        "inserted": len(inserts),
+        "errors": sorted(errors, key=lambda e: e["row"]),
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "rows_per_sec": round(len(inserts) / elapsed, 1)
+    }), 201
+
+@expense_bp.route("/expenses", methods=["GET"])
+@jwt_required()
+def get_all_expenses():
+    user_id = get_jwt_identity()
+    try:
+        expenses, next_cursor = expense_page(user_id, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    expense_list = []
+    for expense in expenses:
+        expense_list.append({
+            "id": expense.id,
+            "amount": expense.amount,
+            "category": expense.category,
+            "date": expense.date.strftime("%Y-%m-%d")
+        })
+
+    response = jsonify(expense_list)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
+@expense_bp.route("/expenses/trends", methods=["GET"])
+@jwt_required()
+def get_expense_trends():
+    """Spending per day / week / month, read from the rollups"""
+    user_id = int(get_jwt_identity())
+    granularity = request.args.get("granularity", "month")
+    if granularity not in ROLLUP_GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of: {', '.join(ROLLUP_GRANULARITIES)}"}), 400
+    try:
+        start = request.args.get("from") and rollup_start(granularity, parse_day(request.args["from"], "from").date())
+        end = request.args.get("to") and parse_day(request.args["to"], "to").date() + timedelta(days=1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    category_id = None
+    if request.args.get("category"):
+        category_id = category_id_select(user_id, request.args["category"])
+
+    rows = rollup_history(
+        user_id, granularity,
+        category_id=category_id,
+        start=start or None,
+        end=end or None
+    )
+    names = dict(db.session.query(Category.id, Category.name).filter(Category.user_id == user_id))
+    return jsonify([
+        {
+            "period_start": row.period_start.strftime("%Y-%m-%d"),
+            "category": names.get(row.category_id),
+            "category_id": row.category_id,
+            "total": row.total,
+            "count": row.count
+        }
+        for row in rows if row.count
+    ]), 200
+
+def export_rows(user_id, args):
+    """Stream a user's expenses in batches of EXPORT_BATCH_SIZE rows.
+
+    yield_per keeps only one batch in memory at a time; on Postgres it also
+    switches to a server-side cursor.
+    """
+    query = filter_expenses(
+        db.select(Expense.id, Expense.amount, Category.name.label("category"), Expense.date)
+        .join(Category, Category.id == Expense.category_id)
+        .where(Expense.user_id == user_id),
+        user_id, args
+    ).order_by(Expense.date, Expense.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    for batch in db.session.execute(query).partitions():
+        yield [
+            (row.id, float(row.amount), row.category, row.date.strftime("%Y-%m-%d") if row.date else None)
+            for row in batch
+        ]
+
+def generate_ndjson(batches):
+    for batch in batches:
+        yield "".join(json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in batch)
+
+def generate_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+@expense_bp.route("/expenses/export", methods=["GET"])
+@jwt_required()
+def export_expenses():
+    user_id = get_jwt_identity()
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be 'ndjson' or 'csv'"}), 400
+
+    # Validate the filters up front; errors inside the stream can't change the status
+    try:
+        filter_expenses(db.select(Expense.id), user_id, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    batches = export_rows(user_id, request.args.to_dict())
+    if export_format == "csv":
+        body, mimetype = generate_csv(batches), "text/csv"
+    else:
+        body, mimetype = generate_ndjson(batches), "application/x-ndjson"
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=expenses.{export_format}"}
+    )
+
+@expense_bp.route("/expenses/<category>", methods=["GET"])
+@jwt_required()
+def get_expenses_by_category(category):
+    user_id = get_jwt_identity()
+
+    # Get budget info first
+    budget, total_spent, savings = get_budget_info(user_id, category)
+    if not budget:
+        return jsonify({"error": f"No budget found for category '{category}'"}), 404
+
+    # Get expenses
+    expenses = Expense.query.filter_by(
+        user_id=user_id,
+        category_id=budget.category_id
+    ).all()
+
+    expense_list = []
+    for expense in expenses:
+        expense_list.append({
+            "id": expense.id,
+            "amount": expense.amount,
+            "date": expense.date.strftime("%Y-%m-%d")
+        })
+
+    return jsonify({
+        "category": budget.category,
+        "category_id": budget.category_id,
+        "budget_limit": budget.limit,
+        "total_spent": total_spent,
+        "savings": savings,
+        "expenses": expense_list
+    }), 200
 
 # GET expense by ID
 @expense_bp.route("/expense/<int:expense_id>", methods=["GET"])
 @jwt_required()
 def get_expense(expense_id):
     expense = Expense.query.get_or_404(expense_id)
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
 
     if expense.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
@@ -93,235 +468,112 @@ def get_expense(expense_id):
 @expense_bp.route("/expense/<int:expense_id>", methods=["PATCH"])
 @jwt_required()
 def update_expense(expense_id):
+    user_id = int(get_jwt_identity())
     data = request.get_json()
 
-    # Check if required fields exist
-    if not all(k in data for k in ["amount", "category", "date"]):
+    # Check if required fields exist; the category may be given by id or by name
+    if not all(k in data for k in ["amount", "date"]) or ("category" not in data and "category_id" not in data):
         return jsonify({"error": "Fields 'amount', 'category', and 'date' are required."}), 400
 
     expense = Expense.query.get(expense_id)
     if not expense:
         return jsonify({"error": "Expense not found"}), 404
-
-    try:
-        parsed_date = datetime.strptime(data["date"], "%Y-%m-%d").date()  # Convert date string to date object
-
-        # Check if the date is valid
-        datetime(parsed_date.year, parsed_date.month, parsed_date.day)
-    except ValueError:
-        return jsonify({"error": "Invalid date. Please check if the date exists in the given month."}), 400
-
-    # Update fields
-    expense.amount = data["amount"]
-    expense.category = data["category"]
-    expense.date = parsed_date  # Store as a `date` object
-
-    try:  # Add a try-except block for database errors
-        db.session.commit()
-
-        return jsonify({
-            "message": "Expense updated successfully!",
-            "expense": {
-                "id": expense.id,
-                "amount": expense.amount,
-                "category": expense.category,
-                "date": expense.date.strftime("%Y-%m-%d")  # Convert back to string for JSON response
-            }
-        }), 200
-    except Exception as e:  # Handle potential database errors
-        db.session.rollback()  # Rollback the transaction in case of error
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
-
-
-# DELETE Expense
-@expense_bp.route("/expense/<int:expense_id>", methods=["DELETE"])
-@jwt_required()
-def delete_expense(expense_id):
-    expense = Expense.query.get_or_404(expense_id)
-    user_id = get_jwt_identity()
-
     if expense.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
 
     try:
-        db.session.delete(expense)
-        db.session.commit()
-        return jsonify({"message": "Expense deleted successfully!"}), 200
-
-    except Exception as e:  # Handle potential database errors
-        db.session.rollback()  # Rollback the transaction in case of error
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Expense, Budget
-from datetime import datetime
-
-expense_bp = Blueprint("expense_bp", __name__)
-
-def get_budget_info(user_id, category):
-    """Get budget and calculate current spending for a category"""
-    budget = Budget.query.filter_by(user_id=user_id, category=category).first()
-    if not budget:
-        return None, None, None
-    
-    total_spent = db.session.query(db.func.sum(Expense.amount)).filter_by(
-        user_id=user_id,
-        category=category
-    ).scalar() or 0.0
-    
-    savings = max(0, float(budget.limit) - float(total_spent))
-    return budget, total_spent, savings
-
-@expense_bp.route("/expense", methods=["POST"])
-@jwt_required()
-def create_expense():
-    user_id = get_jwt_identity()
-    data = request.get_json()
-
-    # Validate required fields
-    required_fields = ["amount", "category", "date"]
-    if not all(field in data for field in required_fields):
-        return jsonify({"error": f"Missing required fields: {', '.join(required_fields)}"}), 400
-
-    # Validate amount
-    try:
-        amount = float(data["amount"])
+        amount = to_decimal(data["amount"])
         if amount <= 0:
             return jsonify({"error": "Amount must be positive"}), 400
     except ValueError:
         return jsonify({"error": "Invalid amount"}), 400
 
-    # Validate date
     try:
-        date = datetime.strptime(data["date"], "%Y-%m-%d").date()
+        parsed_date = datetime.strptime(data["date"], "%Y-%m-%d").date()  # Convert date string to date object
     except ValueError:
-        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+        return jsonify({"error": "Invalid date. Please check if the date exists in the given month."}), 400
 
-    # Check budget exists
-    budget, total_spent, savings = get_budget_info(user_id, data["category"])
-    if not budget:
-        return jsonify({"error": f"No budget found for category '{data['category']}'"}), 400
+    try:
+        category = resolve_category(user_id, data, create=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Check if expense exceeds budget
-    if (total_spent + amount) > budget.limit:
-        remaining = budget.limit - total_spent
-        return jsonify({
-            "error": f"This expense exceeds your budget. You can only spend {remaining:.2f} more in this category."
-        }), 400
-
-    # Create expense
-    expense = Expense(
-        amount=amount,
-        category=data["category"],
-        date=date,
-        user_id=user_id
-    )
+    budget = Budget.query.filter_by(user_id=user_id, category_id=category.id).first()
 
     try:
-        db.session.add(expense)
-        db.session.commit()
+        spent_before = budget and period_spent(budget, parsed_date)
+
+        # Move the old amount out of its running total, then reserve the new
+        # one the same way create_expense does. An edit may leave a budget
+        # that was already over its limit (e.g. after the limit was lowered)
+        # over it, as long as it doesn't add to that period's spending.
+        apply_expense_delta(user_id, expense.category_id, expense.date, -expense.amount, count=-1)
+        if budget:
+            if not reserve_budget(budget, parsed_date, amount) and period_spent(budget, parsed_date) > spent_before:
+                remaining = budget.limit - (period_spent(budget, parsed_date) - amount)
+                db.session.rollback()
+                return jsonify({
+                    "error": f"This expense exceeds your budget. You can only spend {remaining:.2f} more in this category."
+                }), 400
+            queue_threshold_alerts(budget, parsed_date, spent_before, period_spent(budget, parsed_date))
+        else:
+            apply_expense_delta(user_id, category.id, parsed_date, amount)
+
+        # Update fields
+        expense.amount = amount
+        expense.category_id = category.id
+        expense.date = parsed_date
 
-        # Get updated budget info
-        _, updated_total_spent, updated_savings = get_budget_info(user_id, data["category"])
+        db.session.commit()
+        summary_cache.invalidate(user_id)
 
         return jsonify({
-            "message": "Expense created successfully",
+            "message": "Expense updated successfully!",
             "expense": {
                 "id": expense.id,
-                "amount": float(expense.amount),
+                "amount": expense.amount,
                 "category": expense.category,
-                "date": expense.date.strftime("%Y-%m-%d")
-            },
-            "budget_status": {
-                "category": budget.category,
-                "limit": float(budget.limit),
-                "total_spent": float(updated_total_spent),
-                "savings": float(updated_savings)
+                "date": expense.date.strftime("%Y-%m-%d")  # Convert back to string for JSON response
             }
-        }), 201
-
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"error": str(e)}), 500
-
-@expense_bp.route("/expenses", methods=["GET"])
-@jwt_required()
-def get_all_expenses():
-    user_id = get_jwt_identity()
-    expenses = Expense.query.filter_by(user_id=user_id).all()
-    
-    expense_list = []
-    for expense in expenses:
-        expense_list.append({
-            "id": expense.id,
-            "amount": float(expense.amount),
-            "category": expense.category,
-            "date": expense.date.strftime("%Y-%m-%d")
-        })
-    
-    return jsonify(expense_list), 200
-
-@expense_bp.route("/expenses/<category>", methods=["GET"])
-@jwt_required()
-def get_expenses_by_category(category):
-    user_id = get_jwt_identity()
-    
-    # Get budget info first
-    budget, total_spent, savings = get_budget_info(user_id, category)
-    if not budget:
-        return jsonify({"error": f"No budget found for category '{category}'"}), 404
-    
-    # Get expenses
-    expenses = Expense.query.filter_by(
-        user_id=user_id,
-        category=category
-    ).all()
-    
-    expense_list = []
-    for expense in expenses:
-        expense_list.append({
-            "id": expense.id,
-            "amount": float(expense.amount),
-            "date": expense.date.strftime("%Y-%m-%d")
-        })
-    
-    return jsonify({
-        "category": category,
-        "budget_limit": float(budget.limit),
-        "total_spent": float(total_spent),
-        "savings": float(savings),
-        "expenses": expense_list
-    }), 200
+        }), 200
+    except Exception as e:  # Handle potential database errors
+        db.session.rollback()  # Rollback the transaction in case of error
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
 
 @expense_bp.route("/expense/<int:expense_id>", methods=["DELETE"])
 @jwt_required()
 def delete_expense(expense_id):
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     expense = Expense.query.get(expense_id)
-    
+
     if not expense:
         return jsonify({"error": "Expense not found"}), 404
     if expense.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
-    
-    category = expense.category
-    
+
+    category_id = expense.category_id
+
     try:
+        apply_expense_delta(user_id, category_id, expense.date, -expense.amount, count=-1)
         db.session.delete(expense)
         db.session.commit()
-        
+        summary_cache.invalidate(user_id)
+
         # Get updated budget info after deletion
-        budget, total_spent, savings = get_budget_info(user_id, category)
-        
+        budget, total_spent, savings = get_budget_info(user_id, category_id)
+        if not budget:
+            return jsonify({"message": "Expense deleted successfully"}), 200
+
         return jsonify({
             "message": "Expense deleted successfully",
             "budget_status": {
-                "category": category,
-                "limit": float(budget.limit),
-                "total_spent": float(total_spent),
-                "savings": float(savings)
+                "category": budget.category,
+                "limit": budget.limit,
+                "total_spent": total_spent,
+                "savings": savings
             }
         }), 200
-        
+
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
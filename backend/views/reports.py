@@ -0,0 +1,102 @@
+from decimal import Decimal
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, Category, Expense
+from aggregates import ROLLUP_GRANULARITIES, period_start_sql
+from money import ZERO
+from pagination import filter_expenses
+
+reports_bp = Blueprint("reports_bp", __name__)
+
+DEFAULT_TOP_N = 5
+MAX_TOP_N = 50
+SHARE_PLACES = Decimal("0.0001")
+
+def report_query(user_id, *columns):
+    """Aggregate query over one user's expenses, narrowed by the optional
+    category / from / to filters shared with the expense listings"""
+    query = db.session.query(
+        *columns,
+        db.func.sum(Expense.amount).label("total"),
+        db.func.count(Expense.id).label("count")
+    ).filter(Expense.user_id == user_id)
+    return filter_expenses(query, user_id, request.args)
+
+def by_category(query):
+    """Group an aggregate query by category id, naming each group"""
+    return query.join(Category, Category.id == Expense.category_id).group_by(Category.id, Category.name)
+
+def format_row(row, **fields):
+    return dict(fields, total=row.total, count=row.count)
+
+@reports_bp.route("/reports/categories", methods=["GET"])
+@jwt_required()
+def report_by_category():
+    """Total and count per category, largest first"""
+    user_id = int(get_jwt_identity())
+    try:
+        rows = by_category(
+            report_query(user_id, Category.id, Category.name)
+        ).order_by(db.desc("total"), Category.name).all()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify([format_row(row, category=row.name, category_id=row.id) for row in rows]), 200
+
+@reports_bp.route("/reports/timeline", methods=["GET"])
+@jwt_required()
+def report_timeline():
+    """Total and count per day / week / month, optionally split by category"""
+    user_id = int(get_jwt_identity())
+    granularity = request.args.get("granularity", "month")
+    if granularity not in ROLLUP_GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of: {', '.join(ROLLUP_GRANULARITIES)}"}), 400
+    split = request.args.get("split") == "category"
+
+    period_start = period_start_sql(granularity, Expense.date).label("period_start")
+    try:
+        if split:
+            query = by_category(report_query(user_id, period_start, Category.id, Category.name))
+            query = query.group_by(period_start).order_by(period_start, Category.name)
+        else:
+            query = report_query(user_id, period_start).group_by(period_start).order_by(period_start)
+        rows = query.filter(Expense.date.isnot(None)).all()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify([
+        format_row(row, period_start=row.period_start.strftime("%Y-%m-%d"),
+                   **({"category": row.name, "category_id": row.id} if split else {}))
+        for row in rows
+    ]), 200
+
+@reports_bp.route("/reports/top", methods=["GET"])
+@jwt_required()
+def report_top_categories():
+    """The N categories with the highest spending, with their share of the total"""
+    user_id = int(get_jwt_identity())
+    try:
+        limit = int(request.args.get("n", DEFAULT_TOP_N))
+        if not 1 <= limit <= MAX_TOP_N:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": f"n must be between 1 and {MAX_TOP_N}"}), 400
+
+    try:
+        overall = report_query(user_id).one()
+        rows = by_category(
+            report_query(user_id, Category.id, Category.name)
+        ).order_by(db.desc("total"), Category.name).limit(limit).all()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    grand_total = overall.total or ZERO
+    return jsonify({
+        "total": grand_total,
+        "count": overall.count,
+        "categories": [
+            format_row(row, category=row.name, category_id=row.id,
+                       share=(row.total / grand_total).quantize(SHARE_PLACES) if grand_total else ZERO)
+            for row in rows
+        ]
+    }), 200
@@ -1,3 +1,4 @@
+import logging
 import traceback
 from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify
@@ -6,6 +7,8 @@ from flask_jwt_extended import create_access_token, get_jwt_identity, get_jwt, j
 from flask_mail import Message
 from models import db, User, TokenBlocklist
 
+logger = logging.getLogger(__name__)
+
 user_bp = Blueprint("user_bp", __name__)
 
 # @user_bp.route("/user", methods=['POST'])
@@ -102,8 +105,8 @@ def get_user():
             "username": user.username,
             "email": user.email
         }), 200
-    except Exception as e:
-        print(f"Error fetching user: {str(e)}")  # Debugging
+    except Exception:
+        logger.exception("Error fetching user")
         return jsonify({"error": "Internal Server Error"}), 500
 
 